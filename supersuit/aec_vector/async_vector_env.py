@@ -1,80 +1,103 @@
-import ctypes
+import asyncio
 import multiprocessing as mp
 import signal
+import time
 import traceback
 import warnings
 
 import gymnasium
 import numpy as np
+from gymnasium.vector.utils import create_empty_array
 from pettingzoo.utils.agent_selector import agent_selector
 
+from ..vector.utils.async_io import wait_all_readable
+from ..vector.utils.batch import (
+    numpy_deepcopy,
+    numpy_map,
+    read_item,
+    write_batch,
+    write_item,
+)
+from ..vector.utils.shared_array import (
+    create_shared_arrays,
+    create_shared_space,
+    shared_space_arrays,
+)
+from ..vector.utils.timing import TimingStats
 from .base_aec_vec_env import VectorAECEnv
 
 
-class SpaceWrapper:
-    def __init__(self, space):
-        if isinstance(space, gymnasium.spaces.Discrete):
-            self.shape = ()
-            self.dtype = np.dtype(np.int64)
-            self.low = 0
-        elif isinstance(space, gymnasium.spaces.Box):
-            self.shape = space.shape
-            self.dtype = np.dtype(space.dtype)
-            self.low = space.low
-        else:
-            assert False, "ProcVectorEnv only support Box and Discrete types"
-
-
-class SharedData:
-    def __init__(self, array, num_envs, shape, dtype):
-        self.array = array
-        self.num_envs = num_envs
-        self.np_arr = np.frombuffer(array, dtype=dtype).reshape((num_envs,) + shape)
-
-
-def create_shared_data(num_envs, obs_space, act_space):
-    obs_array = mp.Array(
-        np.ctypeslib.as_ctypes_type(obs_space.dtype),
-        int(num_envs * np.prod(obs_space.shape)),
-        lock=False,
+# leaf spaces which have a fixed shape and dtype, and so can be stored in shared memory
+SHARED_LEAF_SPACES = (
+    gymnasium.spaces.Box,
+    gymnasium.spaces.Discrete,
+    gymnasium.spaces.MultiDiscrete,
+    gymnasium.spaces.MultiBinary,
+)
+
+
+def check_shared_space(space):
+    if isinstance(space, gymnasium.spaces.Dict):
+        for subspace in space.spaces.values():
+            check_shared_space(subspace)
+    elif isinstance(space, gymnasium.spaces.Tuple):
+        for subspace in space.spaces:
+            check_shared_space(subspace)
+    else:
+        assert isinstance(
+            space, SHARED_LEAF_SPACES
+        ), "AsyncAECVectorEnv only supports Box, Discrete, MultiDiscrete and MultiBinary spaces, nested in Dict and Tuple spaces"
+
+
+def create_shared_data(num_envs, obs_space, act_space, backend="mp", hugepages=False):
+    """
+    observations and actions are stored with the structure of their space, with every
+    leaf space in its own shared array
+    """
+    check_shared_space(obs_space)
+    check_shared_space(act_space)
+    obs = create_shared_space(obs_space, num_envs, backend, hugepages)
+    act = create_shared_space(act_space, num_envs, backend, hugepages)
+    return [obs, act] + create_shared_arrays(
+        [
+            ((num_envs,), np.float32),  # rewards
+            ((num_envs,), np.float32),  # cumulative rewards
+            ((num_envs,), np.uint8),  # terminations
+            ((num_envs,), np.uint8),  # truncations
+        ],
+        backend,
+        hugepages,
     )
-    act_array = mp.Array(
-        np.ctypeslib.as_ctypes_type(act_space.dtype),
-        int(num_envs * np.prod(act_space.shape)),
-        lock=False,
-    )
-    rew_array = mp.Array(ctypes.c_float, num_envs, lock=False)
-    cum_rew_array = mp.Array(ctypes.c_float, num_envs, lock=False)
-    term_array = mp.Array(ctypes.c_bool, num_envs, lock=False)
-    trunc_array = mp.Array(ctypes.c_bool, num_envs, lock=False)
-    data = (obs_array, act_array, rew_array, cum_rew_array, term_array, trunc_array)
-    return data
 
 
-def create_env_data(num_envs):
-    env_dones = mp.Array(ctypes.c_bool, num_envs, lock=False)
-    agent_sel_idx = mp.Array(ctypes.c_uint, num_envs, lock=False)
-    return env_dones, agent_sel_idx
+def create_env_data(num_envs, backend="mp"):
+    return create_shared_arrays(
+        [
+            ((num_envs,), np.uint8),  # environment terminations
+            ((num_envs,), np.uint8),  # environment truncations
+            ((num_envs,), np.uint32),  # selected agent index
+        ],
+        backend,
+    )
 
 
 class AgentSharedData:
-    def __init__(self, num_envs, obs_space, act_space, data):
-        self.num_envs = num_envs
-
-        obs_array, act_array, rew_array, cum_rew_array, term_array, trunc_array = data
-        self.obs = SharedData(obs_array, num_envs, obs_space.shape, obs_space.dtype)
-        self.act = SharedData(act_array, num_envs, act_space.shape, act_space.dtype)
-        self.rewards = SharedData(rew_array, num_envs, (), np.float32)
-        self._cumulative_rewards = SharedData(cum_rew_array, num_envs, (), np.float32)
-        self.terms = SharedData(term_array, num_envs, (), np.uint8)
-        self.truncs = SharedData(trunc_array, num_envs, (), np.uint8)
+    def __init__(self, data):
+        (
+            self.obs,
+            self.act,
+            self.rewards,
+            self._cumulative_rewards,
+            self.terms,
+            self.truncs,
+        ) = data
+        self.obs_arrays = shared_space_arrays(self.obs)
+        self.act_arrays = shared_space_arrays(self.act)
 
 
 class EnvSharedData:
-    def __init__(self, num_envs, data):
-        env_dones, agent_idx_array = data
-        self.env_dones = SharedData(env_dones, num_envs, (), np.uint8)
-        self.agent_sel_idx = SharedData(agent_idx_array, num_envs, (), np.uint32)
+    def __init__(self, data):
+        self.envs_terms, self.envs_truncs, self.agent_sel_idx = data
 
 
 class _SeperableAECWrapper:
@@ -85,10 +108,17 @@ class _SeperableAECWrapper:
         self.agent_indexes = {
             agent: i for i, agent in enumerate(self.env.possible_agents)
         }
-        self.dead_obss = {
-            agent: np.zeros_like(SpaceWrapper(self.env.observation_space(agent)).low)
+        self.observation_spaces = {
+            agent: self.env.observation_space(agent)
             for agent in self.env.possible_agents
         }
+        self.action_spaces = {
+            agent: self.env.action_space(agent) for agent in self.env.possible_agents
+        }
+        self.dead_obss = {
+            agent: create_empty_array(space, n=None)
+            for agent, space in self.observation_spaces.items()
+        }
 
     def reset(self, seed=None, options=None):
         if seed is not None:
@@ -107,11 +137,11 @@ class _SeperableAECWrapper:
             for agent in self.possible_agents
         }
         self.terms = {
-            agent: [env.terms.get(agent, True) for env in self.envs]
+            agent: [env.terminations.get(agent, True) for env in self.envs]
             for agent in self.possible_agents
         }
         self.truncs = {
-            agent: [env.truncs.get(agent, True) for env in self.envs]
+            agent: [env.truncations.get(agent, True) for env in self.envs]
             for agent in self.possible_agents
         }
         self.infos = {
@@ -121,30 +151,39 @@ class _SeperableAECWrapper:
 
     def observe(self, agent):
         observations = []
-        # TODO: check if works
         for env in self.envs:
-            terminations = np.fromiter(env.terms.values(), dtype=bool)
-            truncations = np.fromiter(env.truncs.values(), dtype=bool)
-            env_done = (terminations | truncations).all()
             observations.append(
-                env.observe(agent) if agent in env_done else self.dead_obss[agent]
+                env.observe(agent)
+                if (agent in env.terminations) or (agent in env.truncations)
+                else self.dead_obss[agent]
             )
         return observations
 
+    def observe_selected(self):
+        """
+        returns the selected agent of every environment and its observation
+        """
+        return [
+            (env.agent_selection, env.observe(env.agent_selection)) for env in self.envs
+        ]
+
     def step(self, agent_step, actions):
         assert len(actions) == len(self.envs)
 
-        # TODO: check if works
-        env_dones = []
+        envs_terms = []
+        envs_truncs = []
         for act, env in zip(actions, self.envs):
-            terminations = np.fromiter(env.terms.values(), dtype=bool)
-            truncations = np.fromiter(env.truncs.values(), dtype=bool)
+            terminations = np.fromiter(env.terminations.values(), dtype=bool)
+            truncations = np.fromiter(env.truncations.values(), dtype=bool)
             env_done = (terminations | truncations).all()
-            env_dones.append(env_done)
+            envs_terms.append(env_done and terminations.all())
+            envs_truncs.append(env_done and not terminations.all())
             if env_done:
                 env.reset()
-            elif env.agent_selection == agent_step:
-                if env.terms[agent_step] or env.truncs[agent_step]:
+            elif agent_step is None or env.agent_selection == agent_step:
+                # with no agent_step, every environment steps its selected agent
+                agent = env.agent_selection
+                if env.terminations[agent] or env.truncations[agent]:
                     act = None
                 env.step(act)
 
@@ -157,11 +196,11 @@ class _SeperableAECWrapper:
             for agent in self.possible_agents
         }
         self.terms = {
-            agent: [env.terms.get(agent, True) for env in self.envs]
+            agent: [env.terminations.get(agent, True) for env in self.envs]
             for agent in self.possible_agents
         }
         self.truncs = {
-            agent: [env.truncs.get(agent, True) for env in self.envs]
+            agent: [env.truncations.get(agent, True) for env in self.envs]
             for agent in self.possible_agents
         }
         self.infos = {
@@ -169,12 +208,89 @@ class _SeperableAECWrapper:
             for agent in self.possible_agents
         }
 
-        return env_dones
+        return envs_terms, envs_truncs
 
     def get_agent_indexes(self):
         return [self.agent_indexes[env.agent_selection] for env in self.envs]
 
 
+# instructions passed through shared memory by SharedSync, others go through the pipes
+PIPE_INSTRUCTION = 0
+STEP_INSTRUCTION = 1
+OBSERVE_INSTRUCTION = 2
+# seconds between checks that the workers are still alive while waiting for them
+LIVENESS_CHECK_INTERVAL = 0.1
+
+
+class SharedSync:
+    """
+    synchronizes the parent with its workers through shared memory and semaphores.
+    The step and observe instructions are written into a shared command word, and
+    workers only send a message back if they have something to report (non empty
+    infos or an error), flagging it in shared memory. Other instructions still go
+    through the pipes.
+    """
+
+    def __init__(self, num_workers, agents, backend="mp"):
+        self.agents = list(agents)
+        self.command, self.reply_flags = create_shared_arrays(
+            [((3,), np.int64), ((num_workers,), np.uint8)], backend
+        )
+        self.command_sems = [mp.Semaphore(0) for _ in range(num_workers)]
+        self.done_sem = mp.Semaphore(0)
+
+    def send(self, pipes, instruction, data):
+        if instruction == "step":
+            step_agent, observe = data
+            # -1 steps the selected agent of every environment
+            self.command.np_arr[:] = (
+                STEP_INSTRUCTION,
+                -1 if step_agent is None else self.agents.index(step_agent),
+                observe,
+            )
+        elif instruction == "observe":
+            self.command.np_arr[:] = (OBSERVE_INSTRUCTION, self.agents.index(data), 0)
+        else:
+            for pipe in pipes:
+                pipe.send((instruction, data))
+            self.command.np_arr[0] = PIPE_INSTRUCTION
+        for sem in self.command_sems:
+            sem.release()
+
+    def wait(self, procs):
+        """
+        waits for all workers, returns which of them sent a message. Raises an error
+        if a worker died, as it would never signal the semaphore.
+        """
+        for _ in self.command_sems:
+            while not self.done_sem.acquire(timeout=LIVENESS_CHECK_INTERVAL):
+                for pidx, proc in enumerate(procs):
+                    if not proc.is_alive():
+                        raise RuntimeError(
+                            f"ProcVectorEnv worker {pidx} died with exit code {proc.exitcode}"
+                        )
+        return self.reply_flags.np_arr.astype(bool)
+
+    def recv(self, worker_idx, pipe):
+        self.command_sems[worker_idx].acquire()
+        instruction, agent_idx, observe = self.command.np_arr.tolist()
+        if instruction == STEP_INSTRUCTION:
+            step_agent = None if agent_idx < 0 else self.agents[agent_idx]
+            return "step", (step_agent, bool(observe))
+        elif instruction == OBSERVE_INSTRUCTION:
+            return "observe", self.agents[agent_idx]
+        return pipe.recv()
+
+    def reply(self, worker_idx, pipe, data, send):
+        has_reply = bool(data)
+        self.reply_flags.np_arr[worker_idx] = has_reply
+        # signals before sending, as the parent only reads the pipes once every
+        # worker is done, and a large reply would block until it is read
+        self.done_sem.release()
+        if has_reply:
+            send(data)
+
+
 def sig_handle(signal_object, argvar):
     raise RuntimeError()
 
@@ -201,18 +317,29 @@ def write_out_data(
         cur_data.truncs.np_arr[start_index : start_index + num_envs] = tcs
 
 
-def write_env_data(env_dones, indexes, num_envs, start_index, shared_data):
-    shared_data.env_dones.np_arr[start_index : start_index + num_envs] = env_dones
+def write_env_data(
+    envs_terms, envs_truncs, indexes, num_envs, start_index, shared_data
+):
+    shared_data.envs_terms.np_arr[start_index : start_index + num_envs] = envs_terms
+    shared_data.envs_truncs.np_arr[start_index : start_index + num_envs] = envs_truncs
     agent_indexes = np.asarray(indexes, dtype=np.uint32)
     shared_data.agent_sel_idx.np_arr[
         start_index : start_index + num_envs
     ] = agent_indexes
 
 
-def write_obs(obs, num_env, start_index, shared_data):
+def write_obs(obs_space, obs, num_env, start_index, shared_data):
     for i, o in enumerate(obs):
         if o is not None:
-            shared_data.obs.np_arr[start_index + i] = o
+            write_item(obs_space, o, shared_data.obs_arrays, start_index + i)
+
+
+def write_selected_obs(obs_spaces, selected_obs, start_index, shared_datas):
+    for i, (agent, obs) in enumerate(selected_obs):
+        if obs is not None:
+            write_item(
+                obs_spaces[agent], obs, shared_datas[agent].obs_arrays, start_index + i
+            )
 
 
 def compress_info(infos):
@@ -242,25 +369,35 @@ def env_worker(
     agent_arrays,
     env_arrays,
     pipe,
+    timing=None,
+    worker_idx=0,
+    sync=None,
 ):
+    def reply(data, send=pipe.send):
+        if sync is None:
+            send(data)
+        else:
+            sync.reply(worker_idx, pipe, data, send)
+
     try:
         env = _SeperableAECWrapper(env_constructors, my_num_envs)
         shared_datas = {
-            agent: AgentSharedData(
-                total_num_envs,
-                SpaceWrapper(env.env.observation_space(agent)),
-                SpaceWrapper(env.env.action_space(agent)),
-                agent_arrays[agent],
-            )
-            for agent in env.possible_agents
+            agent: AgentSharedData(agent_arrays[agent]) for agent in env.possible_agents
         }
 
-        env_datas = EnvSharedData(total_num_envs, env_arrays)
+        env_datas = EnvSharedData(env_arrays)
 
         while True:
-            instruction, data = pipe.recv()
+            if sync is None:
+                instruction, data = pipe.recv()
+            else:
+                instruction, data = sync.recv(worker_idx, pipe)
             if instruction == "reset":
-                env.reset(seed=data[0], options=data[1])
+                seed, options = data
+                # seeds every environment like SyncAECVectorEnv does
+                if seed is not None:
+                    seed += idx_start
+                env.reset(seed=seed, options=options)
                 write_out_data(
                     env.rewards,
                     env._cumulative_rewards,
@@ -270,30 +407,64 @@ def env_worker(
                     idx_start,
                     shared_datas,
                 )
-                env_dones = np.zeros(my_num_envs, dtype=np.uint8)
+                not_done = np.zeros(my_num_envs, dtype=np.uint8)
                 write_env_data(
-                    env_dones,
+                    not_done,
+                    not_done,
                     env.get_agent_indexes(),
                     my_num_envs,
                     idx_start,
                     env_datas,
                 )
-                pipe.send(compress_info(env.infos))
+                write_selected_obs(
+                    env.observation_spaces,
+                    env.observe_selected(),
+                    idx_start,
+                    shared_datas,
+                )
+                reply(compress_info(env.infos))
 
             elif instruction == "observe":
                 agent_observe = data
                 obs = env.observe(agent_observe)
-                write_obs(obs, my_num_envs, idx_start, shared_datas[agent_observe])
-                pipe.send(True)
+                write_obs(
+                    env.observation_spaces[agent_observe],
+                    obs,
+                    my_num_envs,
+                    idx_start,
+                    shared_datas[agent_observe],
+                )
+                reply(None)
+
+            elif instruction == "observe_selected":
+                write_selected_obs(
+                    env.observation_spaces,
+                    env.observe_selected(),
+                    idx_start,
+                    shared_datas,
+                )
+                reply(None)
 
             elif instruction == "step":
                 step_agent, do_observe = data
 
-                actions = shared_datas[step_agent].act.np_arr[
-                    idx_start : idx_start + my_num_envs
-                ]
-
-                env_dones = env.step(step_agent, actions)
+                if step_agent is None:
+                    actions = [
+                        read_item(
+                            shared_datas[sub_env.agent_selection].act_arrays,
+                            idx_start + i,
+                        )
+                        for i, sub_env in enumerate(env.envs)
+                    ]
+                else:
+                    act_arrays = shared_datas[step_agent].act_arrays
+                    actions = [
+                        read_item(act_arrays, idx_start + i) for i in range(my_num_envs)
+                    ]
+
+                step_start = time.perf_counter()
+                envs_terms, envs_truncs = env.step(step_agent, actions)
+                write_start = time.perf_counter()
                 write_out_data(
                     env.rewards,
                     env._cumulative_rewards,
@@ -304,13 +475,31 @@ def env_worker(
                     shared_datas,
                 )
                 write_env_data(
-                    env_dones,
+                    envs_terms,
+                    envs_truncs,
                     env.get_agent_indexes(),
                     my_num_envs,
                     idx_start,
                     env_datas,
                 )
-                pipe.send(compress_info(env.infos))
+                if do_observe:
+                    # saves the observe round trip when every environment selected
+                    # the same agent, which is then the one last() observes
+                    write_selected_obs(
+                        env.observation_spaces,
+                        env.observe_selected(),
+                        idx_start,
+                        shared_datas,
+                    )
+                if timing is not None:
+                    timing.record(worker_idx, "env_step", step_start)
+                    info_start = timing.record(worker_idx, "shm_write", write_start)
+                    reply(
+                        compress_info(env.infos),
+                        lambda data: timing.send(pipe, data, worker_idx, info_start),
+                    )
+                else:
+                    reply(compress_info(env.infos))
 
             elif instruction == "terminate":
                 return
@@ -319,11 +508,36 @@ def env_worker(
                 assert False, "Bad instruction sent to ProcVectorEnv worker"
     except Exception as e:
         tb = traceback.format_exc()
-        pipe.send((e, tb))
+        reply((e, tb))
 
 
 class AsyncAECVectorEnv(VectorAECEnv):
-    def __init__(self, env_constructors, num_cpus=None, return_copy=True):
+    def __init__(
+        self,
+        env_constructors,
+        num_cpus=None,
+        return_copy=True,
+        shared_memory_backend="mp",
+        hugepages=False,
+        timing_stats=False,
+        sync_mode="pipe",
+    ):
+        """
+        parameters:
+            - shared_memory_backend: "mp" (the default) allocates the buffers shared
+                with workers with multiprocessing.RawArray, "shm" with
+                multiprocessing.shared_memory (in /dev/shm on linux).
+            - hugepages: if True, shared buffers are backed with transparent huge pages
+                where the kernel allows it ("shm" backend only).
+            - timing_stats: if True, workers time every phase of their steps in shared
+                counters, which are returned by get_timing_stats.
+            - sync_mode: "pipe" sends every instruction and reply through pipes.
+                "shared" passes step and observe instructions through shared memory
+                and semaphores, so turns without infos send no message at all (see
+                SharedSync), which helps when environments step in microseconds.
+        """
+        if sync_mode not in ("pipe", "shared"):
+            raise ValueError("sync_mode must be either 'pipe' or 'shared'")
         # set signaling so that crashing is handled gracefully
         init_parallel_env()
 
@@ -355,27 +569,34 @@ class AsyncAECVectorEnv(VectorAECEnv):
         all_arrays = {
             agent: create_shared_data(
                 num_envs,
-                SpaceWrapper(self.observation_space(agent)),
-                SpaceWrapper(self.action_space(agent)),
+                self.observation_space(agent),
+                self.action_space(agent),
+                shared_memory_backend,
+                hugepages,
             )
             for agent in self.possible_agents
         }
 
         self.shared_datas = {
-            agent: AgentSharedData(
-                num_envs,
-                SpaceWrapper(env.observation_space(agent)),
-                SpaceWrapper(env.action_space(agent)),
-                all_arrays[agent],
-            )
-            for agent in env.possible_agents
+            agent: AgentSharedData(all_arrays[agent]) for agent in env.possible_agents
         }
 
-        env_arrays = create_env_data(num_envs)
+        env_arrays = create_env_data(num_envs, shared_memory_backend)
 
-        self.env_datas = EnvSharedData(num_envs, env_arrays)
+        self.env_datas = EnvSharedData(env_arrays)
         self.return_copy = return_copy
+        self.timing = (
+            TimingStats(num_cpus, shared_memory_backend, hugepages)
+            if timing_stats
+            else None
+        )
+        self.sync = (
+            SharedSync(num_cpus, self.possible_agents, shared_memory_backend)
+            if sync_mode == "shared"
+            else None
+        )
 
+        self.closed = False
         self.procs = []
         self.pipes = [mp.Pipe() for _ in range(num_cpus)]
         self.con_ins = [con_in for con_in, con_out in self.pipes]
@@ -398,6 +619,9 @@ class AsyncAECVectorEnv(VectorAECEnv):
                     all_arrays,
                     env_arrays,
                     self.con_outs[pidx],
+                    self.timing,
+                    pidx,
+                    self.sync,
                 ),
             )
             self.procs.append(proc)
@@ -416,10 +640,25 @@ class AsyncAECVectorEnv(VectorAECEnv):
             cur_selection = self._agent_selector.next()
         return cur_selection
 
-    def _receive_info(self):
+    def _send_all(self, instruction, data):
+        if self.sync is None:
+            for cin in self.con_ins:
+                cin.send((instruction, data))
+        else:
+            self.sync.send(self.con_ins, instruction, data)
+
+    def _receive_info(self, timed=False):
+        sent = None if self.sync is None else self.sync.wait(self.procs)
         all_data = []
-        for cin in self.con_ins:
-            data = cin.recv()
+        for pidx, cin in enumerate(self.con_ins):
+            if sent is not None and not sent[pidx]:
+                # the worker had nothing to report
+                all_data.append({})
+                continue
+            if timed and self.timing is not None:
+                data = self.timing.recv(cin, pidx)
+            else:
+                data = cin.recv()
             if isinstance(data, tuple):
                 err, tb = data
                 print(tb)
@@ -431,12 +670,12 @@ class AsyncAECVectorEnv(VectorAECEnv):
 
     def copy(self, data):
         if self.return_copy:
-            return np.copy(data)
+            return numpy_deepcopy(data)
         else:
             return data
 
-    def _load_next_data(self, reset):
-        all_compressed_info = self._receive_info()
+    def _load_next_data(self, reset, observe=True, grouped=False):
+        all_compressed_info = self._receive_info(timed=not reset)
 
         all_info = decompress_info(
             self.possible_agents, self.num_envs, self.env_starts, all_compressed_info
@@ -453,17 +692,18 @@ class AsyncAECVectorEnv(VectorAECEnv):
         )
 
         assert not np.all(passes), "something went wrong with finding agent"
-        if np.any(passes) or self.order_is_nondeterministic:
+        # grouped steps do not pass environments
+        if not grouped and (np.any(passes) or self.order_is_nondeterministic):
             warnings.warn(
                 "The agent order of sub-environments of ProcVectorEnv differs, likely due to agent death. The ProcVectorEnv only returns one agent at a time, so it will now 'pass' environments where the current agent is not active, taking up to O(n) more time"
             )
             self.order_is_nondeterministic = True
 
-        self.terms = {
+        self.terminations = {
             agent: self.copy(self.shared_datas[agent].terms.np_arr)
             for agent in self.possible_agents
         }
-        self.truncs = {
+        self.truncations = {
             agent: self.copy(self.shared_datas[agent].truncs.np_arr)
             for agent in self.possible_agents
         }
@@ -476,9 +716,16 @@ class AsyncAECVectorEnv(VectorAECEnv):
             for agent in self.possible_agents
         }
         self.infos = all_info
-        env_dones = self.env_datas.env_dones.np_arr
         self.passes = self.copy(passes)
-        self.env_dones = self.copy(env_dones)
+        # the workers already wrote the observations of the selected agent
+        self.observed_agent = (
+            self.agent_selection if observe and not np.any(passes) else None
+        )
+        # the workers wrote the observations of the selected agent of every environment
+        self.selected_observed = observe
+        self.envs_terminations = self.copy(self.env_datas.envs_terms.np_arr)
+        self.envs_truncations = self.copy(self.env_datas.envs_truncs.np_arr)
+        self.env_dones = self.envs_terminations | self.envs_truncations
 
     def last(self, observe=True):
         last_agent = self.agent_selection
@@ -486,46 +733,113 @@ class AsyncAECVectorEnv(VectorAECEnv):
         return (
             obs,
             self._cumulative_rewards[last_agent],
-            self.truncs[last_agent],
-            self.terms[last_agent],
-            self.env_dones,
+            self.terminations[last_agent],
+            self.truncations[last_agent],
+            self.envs_terminations,
+            self.envs_truncations,
             self.passes,
             self.infos[last_agent],
         )
 
     def reset(self, seed=None, options=None):
-        for cin in self.con_ins:
-            cin.send(("reset", (seed, options)))
+        self._send_reset(seed, options)
+        self._load_next_data(True)
 
+    async def reset_async_io(self, seed=None, options=None):
+        """
+        asyncio version of reset, which awaits the workers without blocking the event loop
+        """
+        if self.sync is not None:
+            # workers signal semaphores, which are waited for on a thread
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.reset, seed, options)
+        self._send_reset(seed, options)
+        await wait_all_readable(self.con_ins)
         self._load_next_data(True)
 
+    def _send_reset(self, seed, options):
+        self._send_all("reset", (seed, options))
+
     def step(self, actions, observe=True):
+        self._send_step(actions, observe)
+        self._load_next_data(False, observe)
+
+    async def step_async_io(self, actions, observe=True):
+        """
+        asyncio version of step, which awaits the workers without blocking the event
+        loop, so other coroutines can run while the environments step
+        """
+        if self.sync is not None:
+            # workers signal semaphores, which are waited for on a thread
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.step, actions, observe)
+        self._send_step(actions, observe)
+        await wait_all_readable(self.con_ins)
+        self._load_next_data(False, observe)
+
+    def _send_step(self, actions, observe):
         step_agent = self.agent_selection
 
-        self.shared_datas[self.agent_selection].act.np_arr[:] = actions
-        for cin in self.con_ins:
-            cin.send(("step", (step_agent, observe)))
-
-        self._load_next_data(False)
+        write_batch(
+            self.action_space(step_agent),
+            actions,
+            self.shared_datas[step_agent].act_arrays,
+        )
+        self._send_all("step", (step_agent, observe))
 
     def observe(self, agent):
-        for cin in self.con_ins:
-            cin.send(("observe", agent))
+        if agent != self.observed_agent:
+            self._send_all("observe", agent)
 
-        # wait until all are finished
-        self._receive_info()
+            # wait until all are finished
+            self._receive_info()
 
-        obs = self.copy(self.shared_datas[self.agent_selection].obs.np_arr)
+        obs = self.copy(self.shared_datas[agent].obs_arrays)
         return obs
 
+    def selected_agent_indexes(self):
+        return self.env_datas.agent_sel_idx.np_arr.copy()
+
+    def _observe_selected(self, agent, env_idxs):
+        if not self.selected_observed:
+            self._send_all("observe_selected", None)
+            self._receive_info()
+            self.selected_observed = True
+        return numpy_map(lambda arr: arr[env_idxs], self.shared_datas[agent].obs_arrays)
+
+    def step_grouped(self, actions, observe=True):
+        for agent, env_idxs in self.agent_groups().items():
+            write_batch(
+                self.action_space(agent),
+                actions[agent],
+                self.shared_datas[agent].act_arrays,
+                env_idxs,
+            )
+        self._send_all("step", (None, observe))
+        self._load_next_data(False, observe, grouped=True)
+
+    def get_timing_stats(self):
+        """
+        returns the time every worker spent stepping its environments, writing to
+        shared memory, pickling infos and sending them, and the time spent receiving
+        them, see TimingStats.get_stats. Needs timing_stats=True.
+        """
+        assert self.timing is not None, "get_timing_stats needs timing_stats=True"
+        return self.timing.get_stats()
+
     def action_space(self, agent):
         return self.env.action_space(agent)
 
     def observation_space(self, agent):
         return self.env.observation_space(agent)
 
-    def __del__(self):
-        for cin in self.con_ins:
-            cin.send(("terminate", None))
+    def close(self):
+        if self.closed:
+            return
+        self._send_all("terminate", None)
         for proc in self.procs:
             proc.join()
+        self.closed = True
+
+    def __del__(self):
+        self.close()
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class VectorAECEnv:
     def reset(self, seed=None, options=None):
         """
@@ -27,6 +30,85 @@ class VectorAECEnv:
         Unlike a regular AECEnv, the actions cannot be None
         """
 
+    def selected_agent_indexes(self):
+        """
+        returns the index (in possible_agents) of the selected agent of every environment
+        """
+
+    def _observe_selected(self, agent, env_idxs):
+        """
+        returns the observations of agent in the environments env_idxs, where it is
+        the selected agent
+        """
+
+    def agent_groups(self, agent_idxs=None):
+        """
+        returns a dict mapping every agent which is selected in some environment to
+        the indexes of those environments
+        """
+        if agent_idxs is None:
+            agent_idxs = self.selected_agent_indexes()
+        groups = {}
+        for i, agent in enumerate(self.possible_agents):
+            env_idxs = np.flatnonzero(agent_idxs == i)
+            if len(env_idxs):
+                groups[agent] = env_idxs
+        return groups
+
+    def last_grouped(self, observe=True):
+        """
+        like last, but for the selected agent of every environment instead of a
+        single agent, so no environment is passed when their agent orders differ.
+
+        returns agent_idxs, groups, observations, rewards, terminations, truncations,
+        env_terminations, env_truncations, infos
+
+        agent_idxs: index (in possible_agents) of the selected agent of every environment
+        groups: dict mapping every selected agent to the indexes of its environments
+        observations: dict mapping every selected agent to the observations of its
+            environments, in the order of its group (None if observe is False)
+        rewards, terminations, truncations, infos: values of the selected agent of
+            every environment
+        """
+        agent_idxs = self.selected_agent_indexes()
+        groups = self.agent_groups(agent_idxs)
+        env_idxs = np.arange(self.num_envs)
+
+        def select(values):
+            rows = np.stack([values[agent] for agent in self.possible_agents])
+            return rows[agent_idxs, env_idxs]
+
+        observations = (
+            {
+                agent: self._observe_selected(agent, group_idxs)
+                for agent, group_idxs in groups.items()
+            }
+            if observe
+            else None
+        )
+        infos = [
+            self.infos[self.possible_agents[agent_idx]][i]
+            for i, agent_idx in enumerate(agent_idxs)
+        ]
+        return (
+            agent_idxs,
+            groups,
+            observations,
+            select(self._cumulative_rewards),
+            select(self.terminations),
+            select(self.truncations),
+            self.envs_terminations,
+            self.envs_truncations,
+            infos,
+        )
+
+    def step_grouped(self, actions, observe=True):
+        """
+        steps the selected agent of every environment.
+        actions is a dict mapping every agent of the groups returned by last_grouped
+        to the actions of its environments, in the order of its group.
+        """
+
     def agent_iter(self, max_iter):
         """
         Unlike aec agent_iter, this does not stop on environment done. Instead,
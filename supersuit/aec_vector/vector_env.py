@@ -1,6 +1,8 @@
 import numpy as np
+from gymnasium.vector.utils import create_empty_array
 from pettingzoo.utils.agent_selector import agent_selector
 
+from ..vector.utils.batch import numpy_deepcopy, numpy_map, read_item, write_item
 from .base_aec_vec_env import VectorAECEnv
 
 
@@ -17,6 +19,36 @@ class SyncAECVectorEnv(VectorAECEnv):
         self.max_num_agents = self.env.max_num_agents
         self.possible_agents = self.env.possible_agents
         self._agent_selector = agent_selector(self.possible_agents)
+        self.agent_indexes = {agent: i for i, agent in enumerate(self.possible_agents)}
+
+        # [num_agents, num_envs] arrays, updated in place for the environments which
+        # stepped. self.rewards etc. map every agent to its row.
+        num_agents = len(self.possible_agents)
+        self._reward_rows = np.zeros((num_agents, self.num_envs), dtype=np.float32)
+        self._cumulative_reward_rows = np.zeros(
+            (num_agents, self.num_envs), dtype=np.float32
+        )
+        self._termination_rows = np.ones((num_agents, self.num_envs), dtype=np.uint8)
+        self._truncation_rows = np.ones((num_agents, self.num_envs), dtype=np.uint8)
+        self.rewards = dict(zip(self.possible_agents, self._reward_rows))
+        self._cumulative_rewards = dict(
+            zip(self.possible_agents, self._cumulative_reward_rows)
+        )
+        self.terminations = dict(zip(self.possible_agents, self._termination_rows))
+        self.truncations = dict(zip(self.possible_agents, self._truncation_rows))
+        self.infos = {agent: [{}] * self.num_envs for agent in self.possible_agents}
+
+        # per agent observation buffers, an environment's row is only observed again
+        # once it stepped
+        self.obs_buffers = {
+            agent: create_empty_array(self.observation_space(agent), n=self.num_envs)
+            for agent in self.possible_agents
+        }
+        self.dead_obss = {
+            agent: create_empty_array(self.observation_space(agent), n=None)
+            for agent in self.possible_agents
+        }
+        self._stale_obs = np.ones((num_agents, self.num_envs), dtype=bool)
 
     def action_space(self, agent):
         return self.env.action_space(agent)
@@ -30,53 +62,27 @@ class SyncAECVectorEnv(VectorAECEnv):
             cur_selection = self._agent_selector.next()
         return cur_selection
 
-    def _collect_dicts(self):
-        self.rewards = {
-            agent: np.array(
-                [
-                    env.rewards[agent] if agent in env.rewards else 0
-                    for env in self.envs
-                ],
-                dtype=np.float32,
-            )
-            for agent in self.possible_agents
-        }
-        self._cumulative_rewards = {
-            agent: np.array(
-                [
-                    env._cumulative_rewards[agent]
-                    if agent in env._cumulative_rewards
-                    else 0
-                    for env in self.envs
-                ],
-                dtype=np.float32,
-            )
-            for agent in self.possible_agents
-        }
-        self.terminations = {
-            agent: np.array(
-                [
-                    env.terminations[agent] if agent in env.terminations else True
-                    for env in self.envs
-                ],
-                dtype=np.uint8,
-            )
-            for agent in self.possible_agents
-        }
-        self.truncations = {
-            agent: np.array(
-                [
-                    env.truncations[agent] if agent in env.truncations else True
-                    for env in self.envs
-                ],
-                dtype=np.uint8,
-            )
-            for agent in self.possible_agents
-        }
-        self.infos = {
-            agent: [env.infos[agent] if agent in env.infos else {} for env in self.envs]
-            for agent in self.possible_agents
-        }
+    def _collect_env(self, i):
+        """
+        updates the rows of environment i, after it stepped or was reset
+        """
+        env = self.envs[i]
+        # agents which are not in an environment are dead
+        self._reward_rows[:, i] = 0
+        self._cumulative_reward_rows[:, i] = 0
+        self._termination_rows[:, i] = True
+        self._truncation_rows[:, i] = True
+        for agent, rew in env.rewards.items():
+            self._reward_rows[self.agent_indexes[agent], i] = rew
+        for agent, rew in env._cumulative_rewards.items():
+            self._cumulative_reward_rows[self.agent_indexes[agent], i] = rew
+        for agent, term in env.terminations.items():
+            self._termination_rows[self.agent_indexes[agent], i] = term
+        for agent, trunc in env.truncations.items():
+            self._truncation_rows[self.agent_indexes[agent], i] = trunc
+        for agent in self.possible_agents:
+            self.infos[agent][i] = env.infos.get(agent, {})
+        self._stale_obs[:, i] = True
 
     def reset(self, seed=None, options=None):
         """
@@ -92,20 +98,39 @@ class SyncAECVectorEnv(VectorAECEnv):
         self.agent_selection = self._agent_selector.reset()
         self.agent_selection = self._find_active_agent()
 
-        self._collect_dicts()
+        for i in range(self.num_envs):
+            self._collect_env(i)
         self.envs_terminations = np.zeros(self.num_envs)
         self.envs_truncations = np.zeros(self.num_envs)
 
-    def observe(self, agent):
-        observations = []
-        for env in self.envs:
+    def _refresh_obs(self, agent, env_idxs):
+        agent_idx = self.agent_indexes[agent]
+        space = self.observation_space(agent)
+        buffer = self.obs_buffers[agent]
+        for i in env_idxs[self._stale_obs[agent_idx, env_idxs]]:
+            env = self.envs[i]
             obs = (
                 env.observe(agent)
                 if (agent in env.terminations) or (agent in env.truncations)
-                else np.zeros_like(env.observation_space(agent).low)
+                else self.dead_obss[agent]
             )
-            observations.append(obs)
-        return np.stack(observations)
+            write_item(space, obs, buffer, i)
+        self._stale_obs[agent_idx, env_idxs] = False
+        return buffer
+
+    def observe(self, agent):
+        buffer = self._refresh_obs(agent, np.arange(self.num_envs))
+        return numpy_deepcopy(buffer)
+
+    def selected_agent_indexes(self):
+        return np.array(
+            [self.agent_indexes[env.agent_selection] for env in self.envs],
+            dtype=np.uint32,
+        )
+
+    def _observe_selected(self, agent, env_idxs):
+        buffer = self._refresh_obs(agent, env_idxs)
+        return numpy_map(lambda arr: arr[env_idxs], buffer)
 
     def last(self, observe=True):
         passes = np.array(
@@ -116,47 +141,69 @@ class SyncAECVectorEnv(VectorAECEnv):
         obs = self.observe(last_agent) if observe else None
         return (
             obs,
-            self._cumulative_rewards[last_agent],
-            self.terminations[last_agent],
-            self.truncations[last_agent],
+            self._cumulative_rewards[last_agent].copy(),
+            self.terminations[last_agent].copy(),
+            self.truncations[last_agent].copy(),
             self.envs_terminations,
             self.envs_truncations,
             passes,
-            self.infos[last_agent],
+            list(self.infos[last_agent]),
         )
 
+    def _step_env(self, i, agent, act):
+        """
+        steps environment i if agent is selected in it, or resets it if it is done.
+        Returns whether it was done.
+        """
+        env = self.envs[i]
+        # Prior to the truncation API update, the env was reset if env.agents was an empty list
+        # After the truncation API update, the env needs to be reset if every agent is terminated OR truncated
+        terminations = np.fromiter(env.terminations.values(), dtype=bool)
+        truncations = np.fromiter(env.truncations.values(), dtype=bool)
+        env_done = (terminations | truncations).all()
+
+        if env_done:
+            env.reset()
+            self._collect_env(i)
+        elif env.agent_selection == agent:
+            if isinstance(type(act), np.ndarray):
+                act = np.array(act)
+            act = (
+                act
+                if not (self.terminations[agent][i] or self.truncations[agent][i])
+                else None
+            )  # if the agent is dead, set action to None
+            env.step(act)
+            self._collect_env(i)
+        return env_done
+
     def step(self, actions, observe=True):
         assert len(actions) == len(
             self.envs
         ), f"{len(actions)} actions given, but there are {len(self.envs)} environments!"
         old_agent = self.agent_selection
 
-        envs_dones = []
-        for i, (act, env) in enumerate(zip(actions, self.envs)):
-            # Prior to the truncation API update, the env was reset if env.agents was an empty list
-            # After the truncation API update, the env needs to be reset if every agent is terminated OR truncated
-            terminations = np.fromiter(env.terminations.values(), dtype=bool)
-            truncations = np.fromiter(env.truncations.values(), dtype=bool)
-            env_done = (terminations | truncations).all()
-            envs_dones.append(env_done)
-
-            if env_done:
-                env.reset()
-            elif env.agent_selection == old_agent:
-                if isinstance(type(act), np.ndarray):
-                    act = np.array(act)
-                act = (
-                    act
-                    if not (
-                        self.terminations[old_agent][i]
-                        or self.truncations[old_agent][i]
-                    )
-                    else None
-                )  # if the agent is dead, set action to None
-                env.step(act)
+        envs_dones = [
+            self._step_env(i, old_agent, act) for i, act in enumerate(actions)
+        ]
+
+        self.agent_selection = self._agent_selector.next()
+        self.agent_selection = self._find_active_agent()
+
+        self.envs_dones = np.array(envs_dones)
+
+    def step_grouped(self, actions, observe=True):
+        env_actions = [None] * self.num_envs
+        for agent, env_idxs in self.agent_groups().items():
+            for j, i in enumerate(env_idxs):
+                env_actions[i] = read_item(actions[agent], j)
+
+        envs_dones = [
+            self._step_env(i, env.agent_selection, act)
+            for i, (env, act) in enumerate(zip(self.envs, env_actions))
+        ]
 
         self.agent_selection = self._agent_selector.next()
         self.agent_selection = self._find_active_agent()
 
         self.envs_dones = np.array(envs_dones)
-        self._collect_dicts()
@@ -3,3 +3,5 @@ from .constructors import MakeCPUAsyncConstructor  # NOQA
 from .markov_vector_wrapper import MarkovVectorEnv  # NOQA
 from .multiproc_vec import ProcConcatVec  # NOQA
 from .single_vec_env import SingleVecEnv  # NOQA
+from .sync_batch_env import SyncBatchEnv  # NOQA
+from .threaded_concat_vec_env import ThreadedConcatVecEnv  # NOQA
@@ -1,9 +1,13 @@
+import itertools
+
 import gymnasium.vector
 import numpy as np
 from gymnasium.spaces import Discrete
-from gymnasium.vector.utils import concatenate, create_empty_array, iterate
+from gymnasium.vector.utils import create_empty_array, iterate
 
-from .single_vec_env import SingleVecEnv
+from .sync_batch_env import SyncBatchEnv
+from .utils.batch import is_batched, numpy_slice, write_batch
+from .utils.columnar_info import columns_to_infos, infos_to_columns
 
 
 def transpose(ll):
@@ -19,55 +23,121 @@ def iterate_discrete(space, items):
 
 
 class ConcatVecEnv(gymnasium.vector.VectorEnv):
-    def __init__(self, vec_env_fns, obs_space=None, act_space=None):
-        self.vec_envs = vec_envs = [vec_env_fn() for vec_env_fn in vec_env_fns]
-        for i in range(len(vec_envs)):
-            if not hasattr(vec_envs[i], "num_envs"):
-                vec_envs[i] = SingleVecEnv([lambda: vec_envs[i]])
+    def __init__(self, vec_env_fns, obs_space=None, act_space=None, info_mode="list"):
+        """
+        parameters:
+            - info_mode: "list" returns infos as a list of dicts, one per environment.
+                "dict" returns a dict of arrays following the gymnasium vector env
+                convention, where info["_" + key] masks the environments which
+                returned that key.
+        """
+        if info_mode not in ("list", "dict"):
+            raise ValueError("info_mode must be either 'list' or 'dict'")
+        self.info_mode = info_mode
+        envs = [vec_env_fn() for vec_env_fn in vec_env_fns]
+        self.vec_envs = vec_envs = []
+        # reset seeds each sub vector env with seed + the index of its first constructor
+        self.seed_offsets = []
+        num_constructors = 0
+        for is_vec_env, group in itertools.groupby(
+            envs, key=lambda env: hasattr(env, "num_envs")
+        ):
+            group = list(group)
+            batch = group if is_vec_env else self.batch_gym_envs(group)
+            for vec_env in batch:
+                vec_envs.append(vec_env)
+                self.seed_offsets.append(num_constructors)
+                num_constructors += 1 if is_vec_env else vec_env.num_envs
         self.metadata = self.vec_envs[0].metadata
         self.render_mode = self.vec_envs[0].render_mode
         self.observation_space = vec_envs[0].observation_space
         self.action_space = vec_envs[0].action_space
         tot_num_envs = sum(env.num_envs for env in vec_envs)
         self.num_envs = tot_num_envs
+        self.obs_buffer = None
+        self.compute_reward_fn = None
+        # action batches are assembled in this buffer, allocated once
+        self.act_batch = create_empty_array(self.action_space, n=tot_num_envs)
+
+    def set_obs_buffer(self, obs_buffer):
+        """
+        makes reset and step write the observations into obs_buffer (arrays with a
+        leading num_envs dimension, structured like the observation space) and
+        return it, instead of allocating new arrays. None restores the default.
+        """
+        self.obs_buffer = obs_buffer
+
+    def batch_gym_envs(self, gym_envs):
+        """
+        returns the sub vector envs which step a run of consecutive gymnasium envs
+        """
+        return [
+            SyncBatchEnv([lambda env=env: env for env in gym_envs], return_copy=False)
+        ]
+
+    def map_vec_envs(self, fn, *args):
+        """
+        returns [fn(vec_env, *vec_env_args) for every sub vector env], where
+        vec_env_args are the elements of args matching that vec env
+        """
+        return [
+            fn(vec_env, *vec_env_args)
+            for vec_env, *vec_env_args in zip(self.vec_envs, *args)
+        ]
 
     def reset(self, seed=None, options=None):
-        _res_obs = []
-        _res_infos = []
-
         if seed is not None:
-            for i in range(len(self.vec_envs)):
-                _obs, _info = self.vec_envs[i].reset(seed=seed + i, options=options)
-                _res_obs.append(_obs)
-                _res_infos.append(_info)
+            seeds = [seed + offset for offset in self.seed_offsets]
         else:
-            for i in range(len(self.vec_envs)):
-                _obs, _info = self.vec_envs[i].reset(options=options)
-                _res_obs.append(_obs)
-                _res_infos.append(_info)
+            seeds = [None] * len(self.vec_envs)
+        _res_obs, _res_infos = transpose(
+            self.map_vec_envs(
+                lambda venv, venv_seed: venv.reset(seed=venv_seed, options=options),
+                seeds,
+            )
+        )
 
         # flatten infos (also done in step function)
         flattened_infos = [info for sublist in _res_infos for info in sublist]
 
-        return self.concat_obs(_res_obs), flattened_infos
+        return self.concat_obs(_res_obs), self.format_infos(flattened_infos)
 
-    def concat_obs(self, observations):
-        return concatenate(
-            self.observation_space,
-            [
-                item
-                for obs in observations
-                for item in iterate(self.observation_space, obs)
-            ],
-            create_empty_array(self.observation_space, n=self.num_envs),
-        )
+    def format_infos(self, infos):
+        if self.info_mode == "dict":
+            return columns_to_infos(self.num_envs, infos_to_columns(infos))
+        return infos
 
-    def concatenate_actions(self, actions, n_actions):
-        return concatenate(
-            self.action_space,
-            actions,
-            create_empty_array(self.action_space, n=n_actions),
-        )
+    def concat_obs(self, observations):
+        obs_batch = self.obs_buffer
+        if obs_batch is None:
+            # every element is written below, so the arrays need no initialization
+            obs_batch = create_empty_array(
+                self.observation_space, n=self.num_envs, fn=np.empty
+            )
+        # one copy per array of every sub vector env's batch
+        idx = 0
+        for venv, obs in zip(self.vec_envs, observations):
+            write_batch(
+                self.observation_space,
+                obs,
+                numpy_slice(obs_batch, idx, idx + venv.num_envs),
+            )
+            idx += venv.num_envs
+        return obs_batch
+
+    def split_actions(self, actions):
+        """
+        returns the actions of every sub vector env, as views into the batch of actions
+        """
+        if not is_batched(self.action_space, actions):
+            write_batch(self.action_space, actions, self.act_batch)
+            actions = self.act_batch
+        venv_actions = []
+        idx = 0
+        for venv in self.vec_envs:
+            venv_actions.append(numpy_slice(actions, idx, idx + venv.num_envs))
+            idx += venv.num_envs
+        return venv_actions
 
     def step_async(self, actions):
         self._saved_actions = actions
@@ -76,18 +146,8 @@ class ConcatVecEnv(gymnasium.vector.VectorEnv):
         return self.step(self._saved_actions)
 
     def step(self, actions):
-        data = []
-        idx = 0
-        actions = list(iterate(self.action_space, actions))
-        for venv in self.vec_envs:
-            data.append(
-                venv.step(
-                    self.concatenate_actions(
-                        actions[idx : idx + venv.num_envs], venv.num_envs
-                    )
-                )
-            )
-            idx += venv.num_envs
+        venv_actions = self.split_actions(actions)
+        data = self.map_vec_envs(lambda venv, act: venv.step(act), venv_actions)
         observations, rewards, terminations, truncations, infos = transpose(data)
         observations = self.concat_obs(observations)
         rewards = np.concatenate(rewards, axis=0)
@@ -96,31 +156,51 @@ class ConcatVecEnv(gymnasium.vector.VectorEnv):
         infos = [
             info for sublist in infos for info in sublist
         ]  # flatten infos from nested lists
+        infos = self.format_infos(infos)
         return observations, rewards, terminations, truncations, infos
 
     def render(self):
         return self.vec_envs[0].render()
 
+    def render_all(self):
+        """
+        returns the frames of all sub vector envs stacked in an array, which
+        needs environments with render_mode='rgb_array'
+        """
+        frames = self.map_vec_envs(
+            lambda venv: venv.render_all()
+            if hasattr(venv, "render_all")
+            else [venv.render()]
+        )
+        return np.stack([frame for venv_frames in frames for frame in venv_frames])
+
     def close(self):
         for vec_env in self.vec_envs:
             vec_env.close()
 
+    def set_compute_reward_fn(self, compute_reward_fn):
+        """
+        registers a vectorized compute_reward(achieved_goal, desired_goal, info)
+        function, which compute_reward calls instead of the sub vector envs' method.
+        """
+        self.compute_reward_fn = compute_reward_fn
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        """
+        computes the rewards of a batch of goals, which can belong to any of the
+        environments since they all share the same reward function
+        """
+        if self.compute_reward_fn is not None:
+            return self.compute_reward_fn(achieved_goal, desired_goal, info)
+        return self.vec_envs[0].compute_reward(achieved_goal, desired_goal, info)
+
     def env_method(self, method_name, *method_args, indices, **method_kwargs):
 
         if method_name == "compute_reward": 
-            return [self.vec_envs[0].compute_reward(*method_args, **method_kwargs),]
+            return [self.compute_reward(*method_args, **method_kwargs),]
         else:
             raise Exception("Method name not found when calling env_method")
 
-
-
-    # def compute_reward(self, achieved_goal, desired_goal, info):
-    #     print(f"achieved_goal: {achieved_goal}")
-    #     print(f"desired_goal: {desired_goal}")
-    #     print(f"info: {info}")
-    #     return self.vec_envs[0].compute_reward(achieved_goal, desired_goal, info) 
-        
-
     def env_is_wrapped(self, wrapper_class):
         return sum(
             [sub_venv.env_is_wrapped(wrapper_class) for sub_venv in self.vec_envs], []
@@ -1,5 +1,9 @@
+import functools
+
 from .concat_vec_env import ConcatVecEnv
 from .multiproc_vec import ProcConcatVec
+from .threaded_concat_vec_env import ThreadedConcatVecEnv
+from .utils.cpu_affinity import worker_cpu_affinities
 
 
 class call_wrap:
@@ -11,16 +15,61 @@ class call_wrap:
         return self.fn(self.data)
 
 
-def MakeCPUAsyncConstructor(max_num_cpus):
+def MakeCPUAsyncConstructor(
+    max_num_cpus,
+    return_copy=True,
+    info_mode="list",
+    cpu_pinning="spread",
+    respawn_workers=False,
+    load_balance=False,
+    max_macro_steps=0,
+    shared_memory_backend="mp",
+    hugepages=False,
+    num_threads=0,
+    timing_stats=False,
+):
+    if num_threads == 0 or num_threads == 1:
+        concat_vec_env = ConcatVecEnv
+    else:
+        concat_vec_env = functools.partial(
+            ThreadedConcatVecEnv, num_threads=num_threads
+        )
+
     if max_num_cpus == 0 or max_num_cpus == 1:
-        return ConcatVecEnv
+        # options of the worker processes, which would otherwise be silently ignored
+        worker_options = [
+            name
+            for name, is_set in [
+                ("return_copy", not return_copy),
+                ("cpu_pinning", cpu_pinning not in ("spread", None)),
+                ("respawn_workers", respawn_workers),
+                ("load_balance", load_balance),
+                ("max_macro_steps", max_macro_steps > 0),
+                ("shared_memory_backend", shared_memory_backend != "mp"),
+                ("hugepages", hugepages),
+                ("timing_stats", timing_stats),
+            ]
+            if is_set
+        ]
+        if worker_options:
+            raise ValueError(
+                f"{', '.join(worker_options)} only apply to worker processes, which are not started with fewer than 2 cpus"
+            )
+        return functools.partial(concat_vec_env, info_mode=info_mode)
     else:
 
         def constructor(env_fn_list, obs_space, act_space):
-            example_env = env_fn_list[0]()
-            envs_per_env = getattr(example_env, "num_envs", 1)
-
             num_fns = len(env_fn_list)
+            if shared_memory_backend == "mp":
+                # mp buffers must exist before the workers start,
+                # so the number of environments is needed up front
+                example_env = env_fn_list[0]()
+                tot_num_envs = num_fns * getattr(example_env, "num_envs", 1)
+                metadata = example_env.metadata
+            else:
+                # workers report it while building their environments in parallel
+                tot_num_envs = metadata = None
+
             envs_per_cpu = (num_fns + max_num_cpus - 1) // max_num_cpus
 
             env_cpu_div = []
@@ -31,13 +80,30 @@ def MakeCPUAsyncConstructor(max_num_cpus):
                 env_cpu_div.append(env_fn_list[start_idx:end_idx])
                 num_envs_alloced = end_idx
 
-            cat_env_fns = [call_wrap(ConcatVecEnv, env_fns) for env_fns in env_cpu_div]
+            cat_env_fns = [
+                call_wrap(concat_vec_env, env_fns) for env_fns in env_cpu_div
+            ]
+            worker_cpu_pinning = cpu_pinning
+            if num_threads > 1 and cpu_pinning in ("spread", "physical"):
+                # every thread of a worker gets its own cpu
+                worker_cpu_pinning = worker_cpu_affinities(
+                    cpu_pinning, len(cat_env_fns), num_threads
+                )
             return ProcConcatVec(
                 cat_env_fns,
                 obs_space,
                 act_space,
-                num_fns * envs_per_env,
-                example_env.metadata,
+                tot_num_envs,
+                metadata,
+                return_copy=return_copy,
+                info_mode=info_mode,
+                cpu_pinning=worker_cpu_pinning,
+                respawn_workers=respawn_workers,
+                load_balance=load_balance,
+                max_macro_steps=max_macro_steps,
+                shared_memory_backend=shared_memory_backend,
+                hugepages=hugepages,
+                timing_stats=timing_stats,
             )
 
         return constructor
@@ -1,15 +1,22 @@
 import gymnasium.vector
 import numpy as np
-from gymnasium.vector.utils import concatenate, create_empty_array, iterate
+from gymnasium.spaces import Dict, Tuple
+from gymnasium.vector.utils import create_empty_array, iterate
+
+from .utils.batch import write_item
 
 
 class MarkovVectorEnv(gymnasium.vector.VectorEnv):
-    def __init__(self, par_env, black_death=False):
+    def __init__(self, par_env, black_death=False, active_mask=False):
         """
         parameters:
             - par_env: the pettingzoo Parallel environment that will be converted to a gymnasium vector environment
             - black_death: whether to give zero valued observations and 0 rewards when an agent is done, allowing for environments with multiple numbers of agents.
                             Is equivalent to adding the black death wrapper, but somewhat more efficient.
+            - active_mask: whether to allow agent death by tracking which agents are active instead. The rows of agents
+                            which did not return an observation keep their last observation and get 0 rewards. Which rows
+                            are active is stored in the boolean array self.active_mask, and inactive rows get
+                            info["active"] = False, so the mask can also be rebuilt from the infos of a ConcatVecEnv.
 
         The resulting object will be a valid vector environment that has a num_envs
         parameter equal to the max number of agents, will return an array of observations,
@@ -31,20 +38,40 @@ class MarkovVectorEnv(gymnasium.vector.VectorEnv):
         self.num_envs = len(par_env.possible_agents)
         self.black_death = black_death
 
+        # row of every agent in the batches
+        self.agent_indexes = {
+            agent: i for i, agent in enumerate(par_env.possible_agents)
+        }
+        # last observation returned for every agent, used for the inactive rows
+        self.last_observations = {}
+        self.rews = np.zeros(self.num_envs, dtype=np.float32)
+        self.tms = np.zeros(self.num_envs, dtype=np.uint8)
+        self.tcs = np.zeros(self.num_envs, dtype=np.uint8)
+        self.active_mask = np.ones(self.num_envs, dtype=bool) if active_mask else None
+
     def concat_obs(self, obs_dict):
-        obs_list = []
-        for i, agent in enumerate(self.par_env.possible_agents):
-            if agent not in obs_dict:
-                raise AssertionError(
-                    "environment has agent death. Not allowed for pettingzoo_env_to_vec_env_v1 unless black_death is True"
-                )
-            obs_list.append(obs_dict[agent])
-
-        return concatenate(
-            self.observation_space,
-            obs_list,
-            create_empty_array(self.observation_space, self.num_envs),
-        )
+        if self.active_mask is not None:
+            self.active_mask[:] = False
+            for agent in obs_dict:
+                self.active_mask[self.agent_indexes[agent]] = True
+            self.last_observations.update(obs_dict)
+            obs_dict = self.last_observations
+        elif len(obs_dict) != self.num_envs:
+            raise AssertionError(
+                "environment has agent death. Not allowed for pettingzoo_env_to_vec_env_v1 unless black_death is True"
+            )
+        obs_batch = create_empty_array(self.observation_space, self.num_envs)
+        for agent, obs in obs_dict.items():
+            write_item(
+                self.observation_space, obs, obs_batch, self.agent_indexes[agent]
+            )
+        return obs_batch
+
+    def write_rows(self, batch, agent_values, default):
+        batch[:] = default
+        for agent, value in agent_values.items():
+            batch[self.agent_indexes[agent]] = value
+        return batch.copy()
 
     def step_async(self, actions):
         self._saved_actions = actions
@@ -56,16 +83,23 @@ class MarkovVectorEnv(gymnasium.vector.VectorEnv):
         # TODO: should this be changed to infos?
         _observations, infos = self.par_env.reset(seed=seed, options=options)
         observations = self.concat_obs(_observations)
-        infs = [infos.get(agent, {}) for agent in self.par_env.possible_agents]
+        infs = self.flag_inactive(
+            [infos.get(agent, {}) for agent in self.par_env.possible_agents]
+        )
         return observations, infs
 
+    def flag_inactive(self, infs):
+        if self.active_mask is not None:
+            for row in np.flatnonzero(~self.active_mask):
+                # copied, so the environment's own info dicts are left untouched
+                infs[row] = {**infs[row], "active": False}
+        return infs
+
     def step(self, actions):
-        actions = list(iterate(self.action_space, actions))
-        agent_set = set(self.par_env.agents)
+        if isinstance(self.action_space, (Dict, Tuple)):
+            actions = list(iterate(self.action_space, actions))
         act_dict = {
-            agent: actions[i]
-            for i, agent in enumerate(self.par_env.possible_agents)
-            if agent in agent_set
+            agent: actions[self.agent_indexes[agent]] for agent in self.par_env.agents
         }
         observations, rewards, terms, truncs, infos = self.par_env.step(act_dict)
 
@@ -77,18 +111,9 @@ class MarkovVectorEnv(gymnasium.vector.VectorEnv):
             for agent, obs in observations.items():
                 infos[agent]["terminal_observation"] = obs
 
-        rews = np.array(
-            [rewards.get(agent, 0) for agent in self.par_env.possible_agents],
-            dtype=np.float32,
-        )
-        tms = np.array(
-            [terms.get(agent, False) for agent in self.par_env.possible_agents],
-            dtype=np.uint8,
-        )
-        tcs = np.array(
-            [truncs.get(agent, False) for agent in self.par_env.possible_agents],
-            dtype=np.uint8,
-        )
+        rews = self.write_rows(self.rews, rewards, 0)
+        tms = self.write_rows(self.tms, terms, False)
+        tcs = self.write_rows(self.tcs, truncs, False)
         infs = [infos.get(agent, {}) for agent in self.par_env.possible_agents]
 
         if env_done:
@@ -99,9 +124,13 @@ class MarkovVectorEnv(gymnasium.vector.VectorEnv):
             reset_infs = [{} for _ in range(len(self.par_env.possible_agents))]
         # combine standard infos and reset infos
         infs = [{**inf, **reset_inf} for inf, reset_inf in zip(infs, reset_infs)]
+        if not env_done:
+            infs = self.flag_inactive(infs)
 
         assert (
-            self.black_death or self.par_env.agents == self.par_env.possible_agents
+            self.black_death
+            or self.active_mask is not None
+            or self.par_env.agents == self.par_env.possible_agents
         ), "MarkovVectorEnv does not support environments with varying numbers of active agents unless black_death is set to True"
         return observations, rews, tms, tcs, infs
 
@@ -1,22 +1,33 @@
 import copy
 import multiprocessing as mp
+import multiprocessing.connection
 import time
 import traceback
-import psutil, os
+import warnings
 from typing import Optional, Sequence, Union
 
 import gymnasium.vector
 import numpy as np
-from gymnasium.vector.utils import (
-    concatenate,
-    create_empty_array,
-    create_shared_memory,
-    iterate,
-    read_from_shared_memory,
-    write_to_shared_memory,
+from gymnasium.vector.async_vector_env import CloudpickleWrapper
+
+from .utils.async_io import wait_all_readable
+from .utils.batch import numpy_deepcopy, numpy_map, numpy_slice, write_batch
+from .utils.columnar_info import ColumnarInfoBuffer, infos_to_columns
+from .utils.cpu_affinity import set_cpu_affinity, worker_cpu_affinities
+from .utils.load_balance import balanced_partition, max_chunk_cost
+from .utils.shared_array import (
+    SharedArray,
+    create_shared_arrays,
+    create_shared_space,
+    shared_space_arrays,
 )
+from .utils.timing import TimingStats
+
 
-from .utils.shared_array import SharedArray
+# number of steps every worker needs to have taken before load balancing them
+LOAD_BALANCE_MIN_STEPS = 100
+# relative decrease of the slowest worker's step time needed to move environments
+LOAD_BALANCE_MIN_IMPROVEMENT = 0.1
 
 
 def compress_info(infos):
@@ -25,93 +36,289 @@ def compress_info(infos):
 
 
 def decompress_info(num_envs, idx_starts, comp_infos):
-    all_info = [{}] * num_envs
+    all_info = [{} for _ in range(num_envs)]
     for idx_start, comp_infos in zip(idx_starts, comp_infos):
         for i, info in comp_infos:
             all_info[idx_start + i] = info
     return all_info
 
 
-def write_observations(vec_env, env_start_idx, shared_obs, obs):
-    obs = list(iterate(vec_env.observation_space, obs))
-    for i in range(vec_env.num_envs):
-        write_to_shared_memory(
-            vec_env.observation_space,
-            env_start_idx + i,
-            obs[i],
-            shared_obs,
+def gather_infos(info_mode, num_envs, idx_starts, comp_infos, info_buffer=None):
+    """
+    gathers the compressed infos of several workers into the infos of all their
+    environments, reusing info_buffer if given in dict info_mode
+    """
+    if info_mode == "list":
+        return decompress_info(num_envs, idx_starts, comp_infos)
+
+    if info_buffer is None:
+        info_buffer = ColumnarInfoBuffer(num_envs)
+    else:
+        info_buffer.clear()
+    for idx_start, columns in zip(idx_starts, comp_infos):
+        info_buffer.add(idx_start, columns)
+    return info_buffer.get()
+
+
+def flag_respawned_info(info_mode, comp_infos, num_envs):
+    """
+    adds worker_respawned=True to the compressed infos of every environment of a worker
+    """
+    if info_mode == "list":
+        infos = dict(comp_infos)
+        return [
+            (i, {**infos.get(i, {}), "worker_respawned": True}) for i in range(num_envs)
+        ]
+    else:
+        comp_infos["worker_respawned"] = (
+            np.arange(num_envs, dtype=np.int64),
+            np.ones(num_envs, dtype=bool),
         )
+        return comp_infos
+
 
+def write_observations(vec_env, obs_buffer, obs):
+    """
+    writes the batch of observations of a worker into its slice of the shared
+    buffer, unless the vector env already wrote it there (see set_obs_buffer)
+    """
+    if obs is not obs_buffer:
+        write_batch(vec_env.observation_space, obs, obs_buffer)
 
-def numpy_deepcopy(buf):
+
+def is_batch(info, batch_size):
+    return isinstance(info, (list, tuple, np.ndarray)) and len(info) == batch_size
+
+
+def first_leaf(buf):
     if isinstance(buf, dict):
-        return {name: numpy_deepcopy(v) for name, v in buf.items()}
+        return first_leaf(next(iter(buf.values())))
     elif isinstance(buf, tuple):
-        return tuple(numpy_deepcopy(v) for v in buf)
-    elif isinstance(buf, np.ndarray):
-        return buf.copy()
+        return first_leaf(buf[0])
     else:
-        raise ValueError("numpy_deepcopy ")
+        return buf
+
+
+def numpy_concatenate(bufs):
+    if isinstance(bufs[0], dict):
+        return {name: numpy_concatenate([b[name] for b in bufs]) for name in bufs[0]}
+    elif isinstance(bufs[0], tuple):
+        return tuple(numpy_concatenate(list(b)) for b in zip(*bufs))
+    else:
+        return np.concatenate(bufs, axis=0)
+
+
+class WorkerBuffers:
+    """
+    the slices of the buffers shared with the parent process which belong to the
+    environments of a worker
+    """
+
+    def __init__(self, shared_buffers, env_start_idx, env_end_idx):
+        (
+            shared_obs,
+            shared_act,
+            self.rews,
+            self.terms,
+            self.truncs,
+            self.step_times,
+            shared_rollout,
+        ) = shared_buffers
+        self.start = env_start_idx
+        self.end = env_end_idx
+        # this worker's slice of every observation buffer
+        self.obs = [
+            numpy_slice(shared_space_arrays(obs), env_start_idx, env_end_idx)
+            for obs in shared_obs
+        ]
+        self.actions = numpy_slice(
+            shared_space_arrays(shared_act), env_start_idx, env_end_idx
+        )
+        if shared_rollout is not None:
+            (
+                rollout_obs,
+                rollout_act,
+                self.rollout_rews,
+                self.rollout_terms,
+                self.rollout_truncs,
+            ) = shared_rollout
+            self.rollout_obs = numpy_map(
+                lambda arr: arr[:, env_start_idx:env_end_idx],
+                shared_space_arrays(rollout_obs),
+            )
+            self.rollout_actions = numpy_map(
+                lambda arr: arr[:, env_start_idx:env_end_idx],
+                shared_space_arrays(rollout_act),
+            )
+
+    def write(self, buf_idx, rewards, terms, truncs):
+        self.rews[buf_idx].np_arr[self.start : self.end] = rewards
+        self.terms[buf_idx].np_arr[self.start : self.end] = terms
+        self.truncs[buf_idx].np_arr[self.start : self.end] = truncs
+
+    def write_rollout(self, k, rewards, terms, truncs):
+        self.rollout_rews.np_arr[k, self.start : self.end] = rewards
+        self.rollout_terms.np_arr[k, self.start : self.end] = terms
+        self.rollout_truncs.np_arr[k, self.start : self.end] = truncs
+
+
+def worker_step(worker_idx, vec_env, actions, obs_buffer, buffers, timing):
+    """
+    steps the environments of a worker, writing their observations into obs_buffer.
+    Returns the step's results other than observations, and when they were written.
+    """
+    if hasattr(vec_env, "set_obs_buffer"):
+        vec_env.set_obs_buffer(obs_buffer)
+    step_start = time.perf_counter()
+    observations, rewards, terms, truncs, infos = vec_env.step(actions)
+    write_start = time.perf_counter()
+    buffers.step_times.np_arr[worker_idx] += (write_start - step_start, 1)
+    write_observations(vec_env, obs_buffer, observations)
+    written = write_start
+    if timing is not None:
+        timing.record(worker_idx, "env_step", step_start)
+        written = timing.record(worker_idx, "shm_write", write_start)
+    return rewards, terms, truncs, infos, written
+
+
+def worker_compute_reward(vec_env, name, data, goal_buffers):
+    if name == "compute_reward":
+        achieved_goal, desired_goal, info = data
+        return np.asarray(vec_env.compute_reward(achieved_goal, desired_goal, info))
+    start, end, info = data
+    achieved_goal, desired_goal, rewards = goal_buffers
+    rewards.np_arr[start:end] = vec_env.compute_reward(
+        achieved_goal.np_arr[start:end],
+        desired_goal.np_arr[start:end],
+        info,
+    )
+    return None
+
+
+def worker_render_all(vec_env, render_buffer):
+    if hasattr(vec_env, "render_all"):
+        frames = vec_env.render_all()
+    else:
+        frames = [vec_env.render()]
+    if render_buffer is None:
+        return list(frames)
+    # frames are written to shared memory instead of being pickled
+    for i, frame in enumerate(frames):
+        render_buffer[i] = frame
+    return None
 
 
 def async_loop(
-    cpu_index, vec_env_constr, inpt_p, pipe, shared_obs, shared_rews, shared_terms, shared_truncs
+    worker_idx,
+    cpus,
+    vec_env_constr,
+    inpt_p,
+    pipe,
+    shared_buffers,
+    info_mode,
+    timing=None,
 ):
-    p = psutil.Process(os.getpid())
-    p.cpu_affinity([cpu_index])
-    print(f"Task is being processed by process id: {os.getpid()} on CPU core: {cpu_index}")
-
+    if cpus is not None:
+        set_cpu_affinity(cpus)
 
     inpt_p.close()
+    compress = compress_info if info_mode == "list" else infos_to_columns
     try:
         vec_env = vec_env_constr()
 
-        pipe.send(vec_env.num_envs)
-        env_start_idx = pipe.recv()
-        env_end_idx = env_start_idx + vec_env.num_envs
+        pipe.send(
+            {
+                "num_envs": vec_env.num_envs,
+                "observation_space": vec_env.observation_space,
+                "action_space": vec_env.action_space,
+                "metadata": vec_env.metadata,
+            }
+        )
+        env_start_idx, sent_buffers = pipe.recv()
+        buffers = WorkerBuffers(
+            shared_buffers if shared_buffers is not None else sent_buffers,
+            env_start_idx,
+            env_start_idx + vec_env.num_envs,
+        )
+        # set by the parent once it knows the size of the rendered frames
+        render_buffer = None
+        # achieved goals, desired goals and rewards of compute_reward calls
+        goal_buffers = None
         while True:
             instr = pipe.recv()
             comp_infos = []
+            # set by step instructions, whose replies are timed
+            info_start = None
 
             if instr == "close":
                 vec_env.close()
+                return
 
             elif isinstance(instr, tuple):
                 name, data = instr
 
                 if name == "reset":
-                    observations, infos = vec_env.reset(seed=data[0], options=data[1])
-                    comp_infos = compress_info(infos)
-
-                    write_observations(vec_env, env_start_idx, shared_obs, observations)
-                    shared_terms.np_arr[env_start_idx:env_end_idx] = False
-                    shared_truncs.np_arr[env_start_idx:env_end_idx] = False
-                    shared_rews.np_arr[env_start_idx:env_end_idx] = 0.0
+                    seed, options, buf_idx = data
+                    obs_buffer = buffers.obs[buf_idx]
+                    if hasattr(vec_env, "set_obs_buffer"):
+                        vec_env.set_obs_buffer(obs_buffer)
+                    observations, infos = vec_env.reset(seed=seed, options=options)
+                    comp_infos = compress(infos)
+                    write_observations(vec_env, obs_buffer, observations)
+                    buffers.write(buf_idx, 0.0, False, False)
 
                 elif name == "step":
-                    actions = data
-                    actions = concatenate(
-                        vec_env.action_space,
-                        actions,
-                        create_empty_array(vec_env.action_space, n=len(actions)),
+                    buf_idx = data
+                    # actions are written to shared memory by the parent process
+                    rewards, terms, truncs, infos, info_start = worker_step(
+                        worker_idx,
+                        vec_env,
+                        buffers.actions,
+                        buffers.obs[buf_idx],
+                        buffers,
+                        timing,
                     )
-                    observations, rewards, terms, truncs, infos = vec_env.step(actions)
-                    write_observations(vec_env, env_start_idx, shared_obs, observations)
-                    shared_terms.np_arr[env_start_idx:env_end_idx] = terms
-                    shared_truncs.np_arr[env_start_idx:env_end_idx] = truncs
-                    shared_rews.np_arr[env_start_idx:env_end_idx] = rewards
-                    comp_infos = compress_info(infos)
+                    buffers.write(buf_idx, rewards, terms, truncs)
+                    comp_infos = compress(infos)
+
+                elif name == "step_many":
+                    comp_infos = []
+                    for k in range(data):
+                        rewards, terms, truncs, infos, _ = worker_step(
+                            worker_idx,
+                            vec_env,
+                            numpy_map(lambda arr: arr[k], buffers.rollout_actions),
+                            numpy_map(lambda arr: arr[k], buffers.rollout_obs),
+                            buffers,
+                            timing,
+                        )
+                        buffers.write_rollout(k, rewards, terms, truncs)
+                        comp_infos.append(compress(infos))
+                    info_start = time.perf_counter()
 
                 elif name == "env_is_wrapped":
                     comp_infos = vec_env.env_is_wrapped(data)
 
                 elif name == "env_method":
                     method_name, method_args, indices, method_kwargs = data
-                    comp_infos = vec_env.env_method(method_name, *method_args, indices=indices, **method_kwargs)
+                    comp_infos = vec_env.env_method(
+                        method_name, *method_args, indices=indices, **method_kwargs
+                    )
 
-                # elif name == "compute_reward":
-                #     achieved_goal, desired_goal, info = data
-                #     comp_infos = vec_env.compute_reward(achieved_goal, desired_goal, info)
+                elif name == "render_buffer":
+                    if data is None:
+                        render_buffer = None
+                    else:
+                        shared_frames, frame_start = data
+                        render_buffer = shared_frames.np_arr[frame_start:]
+
+                elif name == "compute_reward_buffers":
+                    goal_buffers = data
+
+                elif name in ("compute_reward", "compute_reward_shared"):
+                    comp_infos = worker_compute_reward(
+                        vec_env, name, data, goal_buffers
+                    )
 
                 else:
                     raise AssertionError("bad tuple instruction name: " + name)
@@ -119,11 +326,16 @@ def async_loop(
                 render_result = vec_env.render()
                 if vec_env.render_mode == "rgb_array":
                     comp_infos = render_result
+            elif instr == "render_all":
+                comp_infos = worker_render_all(vec_env, render_buffer)
             elif instr == "terminate":
                 return
             else:
                 raise AssertionError("bad instruction: " + instr)
-            pipe.send(comp_infos)
+            if timing is not None and info_start is not None:
+                timing.send(pipe, comp_infos, worker_idx, info_start)
+            else:
+                pipe.send(comp_infos)
     except BaseException as e:
         tb = traceback.format_exc()
         pipe.send((e, tb))
@@ -131,120 +343,592 @@ def async_loop(
 
 class ProcConcatVec(gymnasium.vector.VectorEnv):
     def __init__(
-        self, vec_env_constrs, observation_space, action_space, tot_num_envs, metadata
+        self,
+        vec_env_constrs,
+        observation_space,
+        action_space,
+        tot_num_envs,
+        metadata,
+        return_copy=True,
+        info_mode="list",
+        cpu_pinning="spread",
+        respawn_workers=False,
+        load_balance=False,
+        max_macro_steps=0,
+        shared_memory_backend="mp",
+        hugepages=False,
+        timing_stats=False,
     ):
+        """
+        parameters:
+            - observation_space, action_space, tot_num_envs, metadata: can be None
+                with the "shm" backend, in which case they are taken from the first
+                worker to build its environments, and the shared buffers are only
+                allocated once all workers reported how many environments they have.
+            - return_copy: if False, observations, rewards, terminations and truncations
+                are returned as views into shared memory instead of copies. Two sets of
+                shared buffers are alternated between, so the returned arrays stay valid
+                until the step after the next one.
+            - info_mode: "list" returns infos as a list of dicts, one per environment.
+                "dict" returns a dict of arrays following the gymnasium vector env
+                convention. Workers then send numeric info values as arrays, only
+                pickling values which are not numeric scalars.
+            - cpu_pinning: how worker processes are pinned to cpus. None or "none" does
+                not pin them, "spread" spreads them over the cpus this process may use
+                (limited by its affinity mask and cgroup cpu quota), "physical" does the
+                same but fills physical cores before their SMT siblings, and a list
+                gives the cpu (or list of cpus) of each worker explicitly.
+            - respawn_workers: if True, a worker which crashes or raises during a step
+                is restarted from its constructor and its environments are reset,
+                instead of raising the error. Those environments are returned as
+                truncated, with worker_respawned=True in their infos.
+            - load_balance: if True, the time each worker takes to step is measured, and
+                on reset environments are moved between workers so they all take about
+                the same time (see rebalance). vec_env_constrs must then be call_wrap
+                objects whose data is the list of environment constructors of a worker,
+                as created by MakeCPUAsyncConstructor.
+            - max_macro_steps: the maximum number of steps step_many can take at once.
+                Shared rollout buffers of that many steps are allocated when it is
+                larger than 0.
+            - shared_memory_backend: "mp" (the default) allocates the buffers shared
+                with workers with multiprocessing.RawArray. "shm" uses
+                multiprocessing.shared_memory, which can be sent to running workers,
+                but lives in /dev/shm on linux, whose size may need to be raised in
+                containers (e.g. docker's 64MB default) for large observations.
+            - hugepages: if True, shared buffers are backed with transparent huge pages
+                where the kernel allows it ("shm" backend only).
+            - timing_stats: if True, workers time every phase of their steps in shared
+                counters, which are returned by get_timing_stats.
+        """
+        if info_mode not in ("list", "dict"):
+            raise ValueError("info_mode must be either 'list' or 'dict'")
+        if shared_memory_backend != "shm" and None in (
+            observation_space,
+            action_space,
+            tot_num_envs,
+        ):
+            raise ValueError(
+                "the spaces and number of environments must be given unless shared_memory_backend is 'shm'"
+            )
         self.observation_space = observation_space
         self.action_space = action_space
-        self.num_envs = num_envs = tot_num_envs
+        self.num_envs = tot_num_envs
         self.metadata = metadata
+        self.return_copy = return_copy
+        self.info_mode = info_mode
+        self.respawn_workers = respawn_workers
+        self.load_balance = load_balance
+        if load_balance:
+            assert all(
+                isinstance(getattr(constr, "data", None), list)
+                for constr in vec_env_constrs
+            ), "load_balance needs the environment constructors of every worker"
+
+        self.shared_memory_backend = shared_memory_backend
+        self.hugepages = hugepages
+        self.max_macro_steps = max_macro_steps
+        self.timing = (
+            TimingStats(len(vec_env_constrs), shared_memory_backend, hugepages)
+            if timing_stats
+            else None
+        )
+        self.buffer_idx = 0
+        self.graceful_shutdown_timeout = 10
+        self.render_buffer = None
+        self.goal_buffers = None
+        self.compute_reward_fn = None
+
+        self.vec_env_constrs = [
+            CloudpickleWrapper(constr) for constr in vec_env_constrs
+        ]
+        # buffers are given to workers when they start if their size is known,
+        # else they are sent by name once every worker reported its environments
+        self.shared_obs = None
+        if None not in (observation_space, action_space, tot_num_envs):
+            self._allocate_buffers()
+
+        self.worker_cpus = worker_cpu_affinities(cpu_pinning, len(vec_env_constrs))
+        self.pipes = [None] * len(vec_env_constrs)
+        self.procs = [None] * len(vec_env_constrs)
+        for index in range(len(vec_env_constrs)):
+            self._start_worker(index)
+
+        env_nums = self._receive_handshakes()
+        if self.num_envs is None:
+            self.num_envs = sum(env_nums)
+        assert sum(env_nums) == self.num_envs
+        if load_balance:
+            num_env_fns = sum(len(constr.data) for constr in vec_env_constrs)
+            assert (
+                self.num_envs % num_env_fns == 0
+            ), "load_balance needs every environment constructor to create as many environments"
 
-        self.shared_obs = create_shared_memory(self.observation_space, n=self.num_envs)
-        self.shared_act = create_shared_memory(self.action_space, n=self.num_envs)
-        self.shared_rews = SharedArray((num_envs,), dtype=np.float32)
-        self.shared_terms = SharedArray((num_envs,), dtype=np.uint8)
-        self.shared_truncs = SharedArray((num_envs,), dtype=np.uint8)
+        shared_buffers = None
+        if self.shared_obs is None:
+            self._allocate_buffers()
+            shared_buffers = self._shared_buffers()
+        self.idx_starts = [0] + np.cumsum(env_nums).tolist()
+        for pipe, idx_start in zip(self.pipes, self.idx_starts):
+            pipe.send((idx_start, shared_buffers))
 
-        self.observations_buffers = read_from_shared_memory(
-            self.observation_space, self.shared_obs, n=self.num_envs
+        # workers stepped by send() whose results have not been received yet,
+        # mapped to the buffer they are writing into
+        self.pending_workers = {}
+
+    def _allocate_buffers(self):
+        """
+        allocates the buffers shared with the workers, once the spaces and the
+        number of environments are known
+        """
+        backend = self.shared_memory_backend
+        hugepages = self.hugepages
+        num_envs = self.num_envs
+        num_buffers = 1 if self.return_copy else 2
+        self.shared_obs = [
+            create_shared_space(self.observation_space, num_envs, backend, hugepages)
+            for _ in range(num_buffers)
+        ]
+        self.shared_act = create_shared_space(
+            self.action_space, num_envs, backend, hugepages
         )
+        self.shared_rews = [
+            SharedArray((num_envs,), np.float32, backend) for _ in range(num_buffers)
+        ]
+        self.shared_terms = [
+            SharedArray((num_envs,), np.uint8, backend) for _ in range(num_buffers)
+        ]
+        self.shared_truncs = [
+            SharedArray((num_envs,), np.uint8, backend) for _ in range(num_buffers)
+        ]
 
-        self.graceful_shutdown_timeout = 10
+        self.info_buffers = [ColumnarInfoBuffer(num_envs) for _ in range(num_buffers)]
+        self.observations_buffers = [
+            shared_space_arrays(shared_obs) for shared_obs in self.shared_obs
+        ]
+        self.actions_buffers = shared_space_arrays(self.shared_act)
+        # total time spent stepping and number of steps taken by every worker
+        self.shared_step_times = SharedArray(
+            (len(self.vec_env_constrs), 2), np.float64, backend
+        )
 
-        pipes = []
-        procs = []
-        
-        num_cpu_cores = psutil.cpu_count(logical=True)
-        print(num_cpu_cores)
-        
-        for index, constr in enumerate(vec_env_constrs):
-            inpt, outpt = mp.Pipe()
-            constr = gymnasium.vector.async_vector_env.CloudpickleWrapper(constr)
-            
-            core_id = index % num_cpu_cores
-            proc = mp.Process(
-                target=async_loop,
-                args=(
-                    core_id,
-                    constr,
-                    inpt,
-                    outpt,
-                    self.shared_obs,
-                    self.shared_rews,
-                    self.shared_terms,
-                    self.shared_truncs,
-                ),
+        self.shared_rollout = None
+        if self.max_macro_steps > 0:
+            rollout_shape = (self.max_macro_steps, num_envs)
+            rollout_obs = create_shared_space(
+                self.observation_space, rollout_shape, backend, hugepages
+            )
+            rollout_act = create_shared_space(
+                self.action_space, rollout_shape, backend, hugepages
             )
-            proc.start()
-            outpt.close()
-            pipes.append(inpt)
-            procs.append(proc)
-
-        self.pipes = pipes
-        self.procs = procs
-
-        num_envs = 0
-        env_nums = self._receive_info()
-        idx_starts = []
-        for pipe, cnum_env in zip(self.pipes, env_nums):
-            cur_env_idx = num_envs
-            num_envs += cnum_env
-            pipe.send(cur_env_idx)
-            idx_starts.append(cur_env_idx)
-        idx_starts.append(num_envs)
-
-        assert num_envs == tot_num_envs
-        self.idx_starts = idx_starts
+            self.rollout_rews = SharedArray(rollout_shape, np.float32, backend)
+            self.rollout_terms = SharedArray(rollout_shape, np.uint8, backend)
+            self.rollout_truncs = SharedArray(rollout_shape, np.uint8, backend)
+            self.rollout_observations = shared_space_arrays(rollout_obs)
+            self.rollout_actions = shared_space_arrays(rollout_act)
+            self.shared_rollout = (
+                rollout_obs,
+                rollout_act,
+                self.rollout_rews,
+                self.rollout_terms,
+                self.rollout_truncs,
+            )
+
+    def _shared_buffers(self):
+        if self.shared_obs is None:
+            return None
+        return (
+            self.shared_obs,
+            self.shared_act,
+            self.shared_rews,
+            self.shared_terms,
+            self.shared_truncs,
+            self.shared_step_times,
+            self.shared_rollout,
+        )
+
+    def _receive_handshakes(self):
+        """
+        receives the handshake every worker sends once its environments are built,
+        in the order they finish. The spaces and metadata of the first one are used
+        if they were not given.
+        """
+        handshakes = [None] * len(self.pipes)
+        waiting = {pipe: index for index, pipe in enumerate(self.pipes)}
+        while waiting:
+            for pipe in mp.connection.wait(list(waiting)):
+                handshake = self._receive(pipe)
+                handshakes[waiting.pop(pipe)] = handshake
+                if self.observation_space is None:
+                    self.observation_space = handshake["observation_space"]
+                if self.action_space is None:
+                    self.action_space = handshake["action_space"]
+                if self.metadata is None:
+                    self.metadata = handshake["metadata"]
+        return [handshake["num_envs"] for handshake in handshakes]
+
+    def _start_worker(self, index):
+        inpt, outpt = mp.Pipe()
+        proc = mp.Process(
+            target=async_loop,
+            args=(
+                index,
+                self.worker_cpus[index],
+                self.vec_env_constrs[index],
+                inpt,
+                outpt,
+                self._shared_buffers(),
+                self.info_mode,
+                self.timing,
+            ),
+        )
+        proc.start()
+        outpt.close()
+        self.pipes[index] = inpt
+        self.procs[index] = proc
+
+    def _send_extra_buffers(self, index):
+        """
+        gives a restarted worker the render and goal buffers the other workers use
+        """
+        pipe = self.pipes[index]
+        if self.render_buffer is not None:
+            frame_start = self.render_frame_starts[index]
+            pipe.send(("render_buffer", (self.render_buffer, frame_start)))
+            self._receive(pipe)
+        if self.goal_buffers is not None:
+            pipe.send(("compute_reward_buffers", self.goal_buffers))
+            self._receive(pipe)
+
+    def _drop_render_buffer(self):
+        """
+        makes every worker send its frames through the pipes again, until render_all
+        allocates a new render buffer
+        """
+        self.render_buffer = None
+        for pipe in self.pipes:
+            pipe.send(("render_buffer", None))
+        self._receive_info()
+
+    def _respawn_worker(self, index, buf_idx):
+        """
+        restarts a crashed worker and resets its environments into buffer buf_idx,
+        returning the compressed infos of the reset flagged with worker_respawned
+        """
+        warnings.warn(
+            f"ProcConcatVec worker {index} crashed, restarting it and resetting its environments"
+        )
+        self._stop_worker(index)
+        self._start_worker(index)
+        self._connect_worker(index)
+        self._send_extra_buffers(index)
+        pipe = self.pipes[index]
+        start, end = self.idx_starts[index : index + 2]
+        pipe.send(("reset", (None, None, buf_idx)))
+        comp_infos = self._receive(pipe)
+
+        self.shared_truncs[buf_idx].np_arr[start:end] = True
+        return flag_respawned_info(self.info_mode, comp_infos, end - start)
+
+    def _connect_worker(self, index):
+        """
+        tells a newly started worker where its environments are in the shared buffers
+        """
+        start, end = self.idx_starts[index : index + 2]
+        assert self._receive(self.pipes[index])["num_envs"] == end - start
+        self.pipes[index].send((start, None))
+
+    def _stop_worker(self, index):
+        pipe, proc = self.pipes[index], self.procs[index]
+        if proc.is_alive():
+            try:
+                pipe.send("close")
+            except OSError:
+                pass
+            proc.join(self.graceful_shutdown_timeout)
+            if proc.is_alive():
+                proc.kill()
+        proc.join()
+        pipe.close()
+
+    def rebalance(self):
+        """
+        moves environment constructors between workers so that every worker takes
+        about the same time to step, based on the step times measured since the
+        last rebalance. Environments keep their index, but the workers whose
+        environments change are restarted, so this should only be done when every
+        environment is about to be reset anyway (reset() calls it when load_balance
+        is True).
+
+        returns whether any environments were moved.
+        """
+        assert self.load_balance, "rebalance needs load_balance=True"
+        assert not self.pending_workers
+        step_times = self.shared_step_times.np_arr
+        if np.any(step_times[:, 1] < LOAD_BALANCE_MIN_STEPS):
+            return False
+
+        worker_env_fns = [constr.fn.data for constr in self.vec_env_constrs]
+        costs = np.concatenate(
+            [
+                np.full(len(env_fns), total_time / num_steps / len(env_fns))
+                for env_fns, (total_time, num_steps) in zip(worker_env_fns, step_times)
+            ]
+        )
+        old_bounds = np.cumsum([0] + [len(env_fns) for env_fns in worker_env_fns])
+        new_bounds = balanced_partition(costs, len(worker_env_fns))
+        if max_chunk_cost(costs, new_bounds) > (
+            1 - LOAD_BALANCE_MIN_IMPROVEMENT
+        ) * max_chunk_cost(costs, old_bounds):
+            return False
+
+        env_fns = sum(worker_env_fns, [])
+        envs_per_fn = self.num_envs // len(env_fns)
+        moved_workers = [
+            w
+            for w in range(len(worker_env_fns))
+            if old_bounds[w] != new_bounds[w] or old_bounds[w + 1] != new_bounds[w + 1]
+        ]
+        for w in moved_workers:
+            self._stop_worker(w)
+            constr = copy.copy(self.vec_env_constrs[w].fn)
+            constr.data = env_fns[new_bounds[w] : new_bounds[w + 1]]
+            self.vec_env_constrs[w] = CloudpickleWrapper(constr)
+        self.idx_starts = [bound * envs_per_fn for bound in new_bounds]
+        for w in moved_workers:
+            self._start_worker(w)
+        for w in moved_workers:
+            self._connect_worker(w)
+        # the number of frames rendered by each worker changed
+        if self.render_buffer is not None:
+            self._drop_render_buffer()
+        for w in moved_workers:
+            self._send_extra_buffers(w)
+        step_times[:] = 0
+        return True
+
+    def _send_step(self, index, buf_idx):
+        try:
+            self.pipes[index].send(("step", buf_idx))
+        except OSError:
+            # the worker died, which is handled when receiving from it
+            if not self.respawn_workers:
+                raise
+
+    def _receive_timed(self, index):
+        """
+        receives the reply of a step or step_many instruction, timing it if
+        timing_stats is set
+        """
+        if self.timing is not None:
+            return self._check_error(self.timing.recv(self.pipes[index], index))
+        return self._receive(self.pipes[index])
+
+    def _receive_step(self, index, buf_idx):
+        try:
+            return self._receive_timed(index)
+        except Exception:
+            if not self.respawn_workers:
+                raise
+            return self._respawn_worker(index, buf_idx)
+
+    def get_timing_stats(self):
+        """
+        returns the time every worker spent stepping its environments, writing to
+        shared memory, pickling infos and sending them, and the time spent receiving
+        them, see TimingStats.get_stats. Needs timing_stats=True.
+        """
+        assert self.timing is not None, "get_timing_stats needs timing_stats=True"
+        return self.timing.get_stats()
+
+    def _next_buffer(self):
+        self.buffer_idx = (self.buffer_idx + 1) % len(self.shared_obs)
+        return self.buffer_idx
 
     def reset(self, seed=None, options=None):
+        self._send_reset(seed, options)
+        return self._reset_wait()
+
+    async def reset_async_io(self, seed=None, options=None):
+        """
+        asyncio version of reset, which awaits the workers without blocking the event loop
+        """
+        self._send_reset(seed, options)
+        await wait_all_readable(self.pipes)
+        return self._reset_wait()
+
+    def _send_reset(self, seed, options):
+        self._check_not_pending("reset")
+        if self.load_balance:
+            self.rebalance()
+        buf_idx = self._next_buffer()
         for i, pipe in enumerate(self.pipes):
             if seed is not None:
-                pipe.send(("reset", (seed + i, options)))
+                pipe.send(("reset", (seed + i, options, buf_idx)))
             else:
-                pipe.send(("reset", (seed, options)))
+                pipe.send(("reset", (seed, options, buf_idx)))
 
-        info = self._receive_info()
+    def _reset_wait(self):
+        buf_idx = self.buffer_idx
+        infos = self._decompress_infos(self._receive_info(), buf_idx)
 
-        return numpy_deepcopy(self.observations_buffers), copy.deepcopy(info)
+        observations = self.observations_buffers[buf_idx]
+        if not self.return_copy:
+            return observations, infos
+        return numpy_deepcopy(observations), copy.deepcopy(infos)
+
+    def _check_not_pending(self, method_name):
+        # replies to other instructions would be interleaved with pending steps
+        assert (
+            not self.pending_workers
+        ), f"{method_name} cannot be called while steps started with send() are not received"
 
     def step_async(self, actions):
-        actions = list(iterate(self.action_space, actions))
-        for i, pipe in enumerate(self.pipes):
-            start, end = self.idx_starts[i : i + 2]
-            pipe.send(("step", actions[start:end]))
+        self._check_not_pending("step")
+        # actions are passed to the workers through shared memory,
+        # so the pipes only need to carry the instruction itself
+        write_batch(self.action_space, actions, self.actions_buffers)
+        buf_idx = self._next_buffer()
+        for index in range(len(self.pipes)):
+            self._send_step(index, buf_idx)
+
+    def _receive(self, pipe):
+        return self._check_error(pipe.recv())
+
+    def _check_error(self, data):
+        if isinstance(data, tuple):
+            e, tb = data
+            print(tb)
+            raise e
+        return data
 
     def _receive_info(self):
-        all_data = []
-        for cin in self.pipes:
-            data = cin.recv()
-            if isinstance(data, tuple):
-                e, tb = data
-                print(tb)
-                raise e
-            all_data.append(data)
-        return all_data
+        return [self._receive(cin) for cin in self.pipes]
 
     def _receive_info_for_specific_environments(self, environment_indices):
         all_data = []
         for index, cin in enumerate(self.pipes):
             if index not in environment_indices: continue
 
-            data = cin.recv()
-            if isinstance(data, tuple):
-                e, tb = data
-                print(tb)
-                raise e
-            all_data.append(data)
+            all_data.append(self._receive(cin))
         return all_data
 
+    def _workers_of_envs(self, env_ids):
+        worker_idxs = np.searchsorted(self.idx_starts, env_ids, side="right") - 1
+        workers = sorted(set(worker_idxs.tolist()))
+        num_worker_envs = sum(
+            self.idx_starts[w + 1] - self.idx_starts[w] for w in workers
+        )
+        assert len(set(env_ids.tolist())) == len(env_ids) == num_worker_envs, (
+            "send() can only step all the environments of a worker together, "
+            f"the environments are split between workers at {self.idx_starts}"
+        )
+        return workers
+
+    def send(self, actions, env_ids=None):
+        """
+        starts stepping the environments in env_ids with the given actions,
+        without waiting for them to finish. The results are collected with recv().
+
+        The environments of a worker process are always stepped together, so env_ids
+        must contain every environment of the workers it touches (see idx_starts).
+        actions[i] is the action for environment env_ids[i].
+        """
+        if env_ids is None:
+            env_ids = np.arange(self.num_envs)
+        env_ids = np.asarray(env_ids, dtype=np.int64)
+        workers = self._workers_of_envs(env_ids)
+        assert not any(
+            w in self.pending_workers for w in workers
+        ), "send() was called for environments whose last step was not received yet"
+
+        write_batch(self.action_space, actions, self.actions_buffers, env_ids)
+        buf_idx = self._next_buffer()
+        for w in workers:
+            self._send_step(w, buf_idx)
+            self.pending_workers[w] = buf_idx
+
+    def recv(self, min_batch=1):
+        """
+        waits until at least min_batch environments started with send() finished
+        stepping, and returns the results of all the environments which are done.
+
+        returns: observations, rewards, terminations, truncations, infos, env_ids
+        where row i of each result belongs to environment env_ids[i].
+        """
+        assert self.pending_workers, "recv() called without any pending send()"
+        min_batch = min(
+            min_batch,
+            sum(
+                self.idx_starts[w + 1] - self.idx_starts[w]
+                for w in self.pending_workers
+            ),
+        )
+        pipe_workers = {self.pipes[w]: w for w in self.pending_workers}
+        ready = {}
+        num_ready_envs = 0
+        while num_ready_envs < min_batch:
+            for pipe in mp.connection.wait(list(pipe_workers)):
+                w = pipe_workers.pop(pipe)
+                ready[w] = self._receive_step(w, self.pending_workers[w])
+                num_ready_envs += self.idx_starts[w + 1] - self.idx_starts[w]
+
+        workers = sorted(ready)
+        env_ids = np.concatenate(
+            [np.arange(self.idx_starts[w], self.idx_starts[w + 1]) for w in workers]
+        )
+        batch_starts = np.cumsum(
+            [0] + [self.idx_starts[w + 1] - self.idx_starts[w] for w in workers]
+        )
+        infos = gather_infos(
+            self.info_mode, len(env_ids), batch_starts, [ready[w] for w in workers]
+        )
+
+        observations = []
+        rewards = []
+        terms = []
+        truncs = []
+        for w in workers:
+            buf_idx = self.pending_workers.pop(w)
+            start, end = self.idx_starts[w : w + 2]
+            observations.append(
+                numpy_slice(self.observations_buffers[buf_idx], start, end)
+            )
+            rewards.append(self.shared_rews[buf_idx].np_arr[start:end])
+            terms.append(self.shared_terms[buf_idx].np_arr[start:end])
+            truncs.append(self.shared_truncs[buf_idx].np_arr[start:end])
+
+        return (
+            numpy_concatenate(observations),
+            np.concatenate(rewards),
+            np.concatenate(terms).astype(bool),
+            np.concatenate(truncs).astype(bool),
+            infos,
+            env_ids,
+        )
+
+    def _decompress_infos(self, compressed_infos, buf_idx):
+        return gather_infos(
+            self.info_mode,
+            self.num_envs,
+            self.idx_starts,
+            compressed_infos,
+            self.info_buffers[buf_idx],
+        )
 
     def step_wait(self):
-        compressed_infos = self._receive_info()
-        infos = decompress_info(self.num_envs, self.idx_starts, compressed_infos)
-        rewards = self.shared_rews.np_arr
-        terms = self.shared_terms.np_arr
-        truncs = self.shared_truncs.np_arr
+        buf_idx = self.buffer_idx
+        compressed_infos = [
+            self._receive_step(index, buf_idx) for index in range(len(self.pipes))
+        ]
+        infos = self._decompress_infos(compressed_infos, buf_idx)
+        observations = self.observations_buffers[buf_idx]
+        rewards = self.shared_rews[buf_idx].np_arr
+        terms = self.shared_terms[buf_idx].np_arr
+        truncs = self.shared_truncs[buf_idx].np_arr
+        if not self.return_copy:
+            return observations, rewards, terms.view(bool), truncs.view(bool), infos
         return (
-            numpy_deepcopy(self.observations_buffers),
+            numpy_deepcopy(observations),
             rewards.copy(),
             terms.astype(bool).copy(),
             truncs.astype(bool).copy(),
@@ -255,10 +939,89 @@ class ProcConcatVec(gymnasium.vector.VectorEnv):
         self.step_async(actions)
         return self.step_wait()
 
+    async def step_async_io(self, actions):
+        """
+        asyncio version of step, which awaits the workers without blocking the event
+        loop, so other coroutines can run while the environments step
+        """
+        self.step_async(actions)
+        await wait_all_readable(self.pipes)
+        return self.step_wait()
+
+    def step_many(self, action_sequence):
+        """
+        steps every environment once for each batch of actions in action_sequence,
+        with workers automatically resetting their environments in between as usual,
+        and only replying once all the steps are done.
+
+        action_sequence is either a list of action batches, or a batch whose arrays have
+        a leading [num_steps, num_envs] shape.
+
+        returns observations, rewards, terminations and truncations with a leading
+        [num_steps, num_envs] shape, and a list of the infos of every step.
+        If return_copy is False, the returned arrays are views of the rollout
+        buffers, which are overwritten by the next step_many call.
+
+        With timing_stats, env_step and shm_write are timed for every step, while
+        info_pickle, pipe_send and pipe_recv are timed once, for the single reply.
+        """
+        self._check_not_pending("step_many")
+        if isinstance(action_sequence, list):
+            num_steps = len(action_sequence)
+        else:
+            num_steps = len(first_leaf(action_sequence))
+        assert (
+            0 < num_steps <= self.max_macro_steps
+        ), f"step_many can take at most max_macro_steps={self.max_macro_steps} steps"
+
+        if isinstance(action_sequence, list):
+            for k, actions in enumerate(action_sequence):
+                write_batch(
+                    self.action_space,
+                    actions,
+                    numpy_map(lambda arr: arr[k], self.rollout_actions),
+                )
+        else:
+            write_batch(
+                self.action_space,
+                action_sequence,
+                self.rollout_actions,
+                slice(0, num_steps),
+            )
+        for pipe in self.pipes:
+            pipe.send(("step_many", num_steps))
+        worker_infos = [self._receive_timed(index) for index in range(len(self.pipes))]
+        infos = [
+            gather_infos(
+                self.info_mode,
+                self.num_envs,
+                self.idx_starts,
+                [comp_infos[k] for comp_infos in worker_infos],
+            )
+            for k in range(num_steps)
+        ]
+
+        observations = numpy_map(lambda arr: arr[:num_steps], self.rollout_observations)
+        rewards = self.rollout_rews.np_arr[:num_steps]
+        terms = self.rollout_terms.np_arr[:num_steps]
+        truncs = self.rollout_truncs.np_arr[:num_steps]
+        if not self.return_copy:
+            return observations, rewards, terms.view(bool), truncs.view(bool), infos
+        return (
+            numpy_deepcopy(observations),
+            rewards.copy(),
+            terms.astype(bool),
+            truncs.astype(bool),
+            infos,
+        )
+
     def __del__(self):
-        self.close()
+        # __init__ may have failed before starting the workers
+        if hasattr(self, "procs"):
+            self.close()
 
     def render(self):
+        self._check_not_pending("render")
         self.pipes[0].send("render")
         render_result = self.pipes[0].recv()
 
@@ -269,6 +1032,42 @@ class ProcConcatVec(gymnasium.vector.VectorEnv):
 
         return render_result
 
+    def render_all(self):
+        """
+        renders the sub environments of all workers in parallel, returning an array
+        of frames of shape [num_frames, height, width, channels], with one frame per
+        sub vector env of each worker (e.g. one per parallel env for MarkovVectorEnv).
+
+        The first call receives the frames through the pipes. With the "shm" backend,
+        a shared buffer is then allocated for them, which workers render into
+        directly on every following call. Use tile_images to turn the frames into
+        a single mosaic image.
+        """
+        self._check_not_pending("render_all")
+        for pipe in self.pipes:
+            pipe.send("render_all")
+        worker_frames = self._receive_info()
+
+        if self.render_buffer is not None:
+            frames = self.render_buffer.np_arr
+            return frames.copy() if self.return_copy else frames
+
+        assert all(
+            frame is not None for frames in worker_frames for frame in frames
+        ), "render_all needs environments with render_mode='rgb_array'"
+        frames = np.stack([frame for frames in worker_frames for frame in frames])
+        if self.shared_memory_backend == "shm":
+            self.render_buffer = SharedArray(
+                frames.shape, np.uint8, "shm", self.hugepages
+            )
+            self.render_frame_starts = np.cumsum(
+                [0] + [len(frames_of_worker) for frames_of_worker in worker_frames]
+            ).tolist()
+            for pipe, frame_start in zip(self.pipes, self.render_frame_starts):
+                pipe.send(("render_buffer", (self.render_buffer, frame_start)))
+            self._receive_info()
+        return frames
+
     def close(self):
         try:
             for pipe, proc in zip(self.pipes, self.procs):
@@ -299,6 +1098,9 @@ class ProcConcatVec(gymnasium.vector.VectorEnv):
         return self.reset(seed)
     
     def env_method(self, method_name, *method_args, indices, **method_kwargs):
+        self._check_not_pending("env_method")
+        if method_name == "compute_reward":
+            return [self.compute_reward(*method_args, **method_kwargs)]
 
         for index, pipe in enumerate(self.pipes):
             if index not in indices: continue
@@ -308,15 +1110,89 @@ class ProcConcatVec(gymnasium.vector.VectorEnv):
         returns = info = self._receive_info_for_specific_environments(indices)
         return np.array(returns)
 
+    def set_compute_reward_fn(self, compute_reward_fn):
+        """
+        registers a vectorized compute_reward(achieved_goal, desired_goal, info)
+        function, which compute_reward then calls in this process instead of
+        sending the goals to the workers.
+        """
+        self.compute_reward_fn = compute_reward_fn
 
-    # def compute_reward(self, achieved_goal, desired_goal, indices=None):
-    #     print(f'indices: {indices}')
-    #     self.pipes[0].send("compute_reward")
+    def _get_goal_buffers(self, achieved_goal, desired_goal):
+        batch_size = len(achieved_goal)
+        if self.goal_buffers is not None:
+            shared_achieved, shared_desired, _ = self.goal_buffers
+            if (
+                len(shared_achieved.np_arr) >= batch_size
+                and shared_achieved.np_arr.shape[1:] == achieved_goal.shape[1:]
+                and shared_desired.np_arr.shape[1:] == desired_goal.shape[1:]
+                and shared_achieved.dtype == achieved_goal.dtype
+                and shared_desired.dtype == desired_goal.dtype
+            ):
+                return self.goal_buffers
+
+        self.goal_buffers = create_shared_arrays(
+            [
+                (achieved_goal.shape, achieved_goal.dtype),
+                (desired_goal.shape, desired_goal.dtype),
+                ((batch_size,), np.float64),
+            ],
+            "shm",
+            self.hugepages,
+        )
+        for pipe in self.pipes:
+            pipe.send(("compute_reward_buffers", self.goal_buffers))
+        self._receive_info()
+        return self.goal_buffers
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        """
+        computes the rewards of a batch of goals, e.g. for hindsight experience replay.
+
+        The function registered with set_compute_reward_fn is used if there is one.
+        Otherwise the batch is split into one chunk per worker, and the workers
+        compute the rewards of their chunk in parallel with the compute_reward method
+        of their environments. With the "shm" backend, goals and rewards are passed
+        through shared memory, only the infos of each chunk are pickled.
+        """
+        if self.compute_reward_fn is not None:
+            return self.compute_reward_fn(achieved_goal, desired_goal, info)
+
+        self._check_not_pending("compute_reward")
+        achieved_goal = np.asarray(achieved_goal)
+        desired_goal = np.asarray(desired_goal)
+        batch_size = len(achieved_goal)
+        shared = self.shared_memory_backend == "shm"
+        if shared:
+            shared_achieved, shared_desired, shared_rewards = self._get_goal_buffers(
+                achieved_goal, desired_goal
+            )
+            shared_achieved.np_arr[:batch_size] = achieved_goal
+            shared_desired.np_arr[:batch_size] = desired_goal
+
+        bounds = np.linspace(0, batch_size, len(self.pipes) + 1).astype(int)
+        workers = []
+        for index, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if start == end:
+                continue
+            info_chunk = info[start:end] if is_batch(info, batch_size) else info
+            if shared:
+                instr = ("compute_reward_shared", (start, end, info_chunk))
+            else:
+                instr = (
+                    "compute_reward",
+                    (achieved_goal[start:end], desired_goal[start:end], info_chunk),
+                )
+            self.pipes[index].send(instr)
+            workers.append(index)
+        rewards = [self._receive(self.pipes[index]) for index in workers]
 
-    #     info = self._receive_info()
-    #     print(f"info: {info}")
+        if shared:
+            return shared_rewards.np_arr[:batch_size].copy()
+        return np.concatenate(rewards)
 
     def env_is_wrapped(self, wrapper_class, indices=None):
+        self._check_not_pending("env_is_wrapped")
         for i, pipe in enumerate(self.pipes):
             pipe.send(("env_is_wrapped", wrapper_class))
 
@@ -0,0 +1,101 @@
+import gymnasium
+import numpy as np
+from gymnasium.vector.utils import create_empty_array, iterate
+
+from .utils.batch import numpy_deepcopy, write_item
+
+
+class SyncBatchEnv:
+    def __init__(self, gym_env_fns, return_copy=True):
+        """
+        vector env which steps a list of gymnasium environments one after the other,
+        writing the results of environment i directly into row i of preallocated
+        batch arrays. Environments which terminate or truncate are reset in the same
+        step, their last observation is put in their info as "terminal_observation".
+
+        parameters:
+            - return_copy: if False, the batch arrays themselves are returned, and
+                overwritten by the next reset or step.
+        """
+        self.envs = [gym_env_fn() for gym_env_fn in gym_env_fns]
+        env = self.envs[0]
+        self.render_mode = env.render_mode
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        self.metadata = env.metadata
+        self.num_envs = len(self.envs)
+        self.return_copy = return_copy
+
+        self.observations = create_empty_array(self.observation_space, n=self.num_envs)
+        self.rewards = np.zeros(self.num_envs, dtype=np.float32)
+        self.terms = np.zeros(self.num_envs, dtype=np.uint8)
+        self.truncs = np.zeros(self.num_envs, dtype=np.uint8)
+
+    def reset(self, seed=None, options=None):
+        infos = []
+        for i, env in enumerate(self.envs):
+            obs, info = env.reset(
+                seed=None if seed is None else seed + i, options=options
+            )
+            write_item(self.observation_space, obs, self.observations, i)
+            infos.append(info)
+        if not self.return_copy:
+            return self.observations, infos
+        return numpy_deepcopy(self.observations), infos
+
+    def step_async(self, actions):
+        self._saved_actions = actions
+
+    def step_wait(self):
+        return self.step(self._saved_actions)
+
+    def step(self, actions):
+        infos = []
+        for i, (env, action) in enumerate(
+            zip(self.envs, iterate(self.action_space, actions))
+        ):
+            obs, rew, term, trunc, info = env.step(action)
+            if term or trunc:
+                info = {**info, "terminal_observation": obs}
+                obs, reset_info = env.reset()
+                info.update(reset_info)
+            write_item(self.observation_space, obs, self.observations, i)
+            self.rewards[i] = rew
+            self.terms[i] = term
+            self.truncs[i] = trunc
+            infos.append(info)
+        if not self.return_copy:
+            return self.observations, self.rewards, self.terms, self.truncs, infos
+        return (
+            numpy_deepcopy(self.observations),
+            self.rewards.copy(),
+            self.terms.copy(),
+            self.truncs.copy(),
+            infos,
+        )
+
+    def render(self):
+        return self.envs[0].render()
+
+    def render_all(self):
+        return [env.render() for env in self.envs]
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        # goal environments of a batch share the same reward function. It is looked
+        # up on the unwrapped env, as get_wrapper_attr needs gymnasium 0.29
+        return self.envs[0].unwrapped.compute_reward(achieved_goal, desired_goal, info)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+    def env_is_wrapped(self, wrapper_class):
+        results = []
+        for env in self.envs:
+            env_tmp = env
+            while isinstance(env_tmp, gymnasium.Wrapper):
+                if isinstance(env_tmp, wrapper_class):
+                    break
+                env_tmp = env_tmp.env
+            results.append(isinstance(env_tmp, wrapper_class))
+        return results
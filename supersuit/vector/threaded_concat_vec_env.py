@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .concat_vec_env import ConcatVecEnv
+
+
+class ThreadedConcatVecEnv(ConcatVecEnv):
+    def __init__(
+        self,
+        vec_env_fns,
+        obs_space=None,
+        act_space=None,
+        info_mode="list",
+        num_threads=None,
+    ):
+        """
+        ConcatVecEnv which resets and steps its sub vector envs concurrently on a
+        thread pool. This only speeds things up for environments which release the
+        GIL while stepping (e.g. physics simulators implemented in C).
+
+        parameters:
+            - num_threads: number of threads of the pool, defaults to one per
+                sub vector env.
+        """
+        self.num_threads = num_threads
+        super().__init__(vec_env_fns, obs_space, act_space, info_mode)
+        self.num_threads = num_threads or len(self.vec_envs)
+        self.executor = ThreadPoolExecutor(max_workers=self.num_threads)
+
+    def batch_gym_envs(self, gym_envs):
+        # one batch per thread, so the threads step them concurrently
+        num_batches = min(self.num_threads or len(gym_envs), len(gym_envs))
+        bounds = np.linspace(0, len(gym_envs), num_batches + 1).astype(int)
+        vec_envs = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            vec_envs += super().batch_gym_envs(gym_envs[start:end])
+        return vec_envs
+
+    def map_vec_envs(self, fn, *args):
+        return list(self.executor.map(fn, self.vec_envs, *args))
+
+    def close(self):
+        super().close()
+        self.executor.shutdown()
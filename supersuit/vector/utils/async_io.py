@@ -0,0 +1,28 @@
+import asyncio
+
+
+async def wait_readable(conn):
+    """
+    waits until a multiprocessing connection has data to receive, without blocking
+    the running event loop. Needs an event loop supporting add_reader (i.e. not the
+    proactor event loop on Windows).
+    """
+    if conn.poll():
+        return
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    fd = conn.fileno()
+
+    def on_readable():
+        if not readable.done():
+            readable.set_result(None)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        await readable
+    finally:
+        loop.remove_reader(fd)
+
+
+async def wait_all_readable(conns):
+    await asyncio.gather(*(wait_readable(conn) for conn in conns))
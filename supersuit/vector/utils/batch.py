@@ -0,0 +1,93 @@
+import numpy as np
+from gymnasium.spaces import Dict, Tuple
+from gymnasium.vector.utils import concatenate, create_empty_array
+
+
+def numpy_map(fn, buf):
+    if isinstance(buf, dict):
+        return {name: numpy_map(fn, v) for name, v in buf.items()}
+    elif isinstance(buf, tuple):
+        return tuple(numpy_map(fn, v) for v in buf)
+    else:
+        return fn(buf)
+
+
+def numpy_slice(buf, start, end):
+    return numpy_map(lambda arr: arr[start:end], buf)
+
+
+def numpy_deepcopy(buf):
+    if isinstance(buf, dict):
+        return {name: numpy_deepcopy(v) for name, v in buf.items()}
+    elif isinstance(buf, tuple):
+        return tuple(numpy_deepcopy(v) for v in buf)
+    elif isinstance(buf, np.ndarray):
+        return buf.copy()
+    else:
+        raise ValueError("numpy_deepcopy ")
+
+
+def is_batched(space, batch):
+    """
+    returns whether batch is already batched like the space (array, dict of arrays,
+    tuple of arrays), as opposed to a list of individual items
+    """
+    if isinstance(space, Dict):
+        return isinstance(batch, dict) and all(
+            is_batched(subspace, batch[name]) for name, subspace in space.spaces.items()
+        )
+    elif isinstance(space, Tuple):
+        return isinstance(batch, tuple) and all(
+            is_batched(subspace, subbatch)
+            for subspace, subbatch in zip(space.spaces, batch)
+        )
+    else:
+        return isinstance(batch, np.ndarray) and batch.dtype != object
+
+
+def read_item(buf, idx):
+    """
+    returns row idx of a batch buffer, as a single item of its space
+    """
+    return numpy_map(lambda arr: arr[idx], buf)
+
+
+def write_item(space, item, buf, idx):
+    """
+    writes a single item of the space into row idx of a batch buffer
+    """
+    if isinstance(space, Dict):
+        for name, subspace in space.spaces.items():
+            write_item(subspace, item[name], buf[name], idx)
+    elif isinstance(space, Tuple):
+        for subspace, subitem, subbuf in zip(space.spaces, item, buf):
+            write_item(subspace, subitem, subbuf, idx)
+    else:
+        buf[idx] = item
+
+
+def write_batch(space, batch, buf, idxs=Ellipsis):
+    """
+    writes a batch into numpy arrays with a leading batch dimension, structured
+    like the space (e.g. the arrays of a buffer created by create_shared_space).
+    The batch can either already be batched (array, dict of arrays, tuple of arrays),
+    or be a list of individual items, which is concatenated into the buffer.
+    If idxs is given, only those rows of the buffer are written.
+    """
+    if isinstance(space, Dict) and isinstance(batch, dict):
+        for name, subspace in space.spaces.items():
+            write_batch(subspace, batch[name], buf[name], idxs)
+    elif isinstance(space, Tuple) and isinstance(batch, tuple):
+        for subspace, subbatch, subbuf in zip(space.spaces, batch, buf):
+            write_batch(subspace, subbatch, subbuf, idxs)
+    elif (
+        not isinstance(space, (Dict, Tuple))
+        and isinstance(batch, np.ndarray)
+        and batch.dtype != object
+    ):
+        buf[idxs] = batch
+    elif idxs is Ellipsis:
+        concatenate(space, batch, buf)
+    else:
+        batch = concatenate(space, batch, create_empty_array(space, n=len(batch)))
+        write_batch(space, batch, buf, idxs)
@@ -0,0 +1,87 @@
+import numpy as np
+
+
+def is_numeric(value):
+    return isinstance(value, (bool, int, float, np.bool_, np.number))
+
+
+def infos_to_columns(infos):
+    """
+    converts a list of info dicts into a dict of columns {key: (env_indexes, values)}.
+    values is a numpy array if every value of that key is a numeric scalar,
+    else it is a list of the values, which will have to be pickled.
+    """
+    columns = {}
+    for i, info in enumerate(infos):
+        for key, value in info.items():
+            if key not in columns:
+                columns[key] = ([], [])
+            idxs, values = columns[key]
+            idxs.append(i)
+            values.append(value)
+
+    for key, (idxs, values) in columns.items():
+        if all(is_numeric(value) for value in values):
+            values = np.asarray(values)
+        columns[key] = (np.asarray(idxs, dtype=np.int64), values)
+    return columns
+
+
+class ColumnarInfoBuffer:
+    """
+    collects infos into a dict of arrays following the gymnasium vector env convention,
+    where info[key] holds the values of all environments, and info["_" + key]
+    is a boolean mask of the environments which actually returned that key.
+
+    Arrays are allocated the first time a key is seen and reused afterwards.
+    """
+
+    def __init__(self, num_envs):
+        self.num_envs = num_envs
+        self.values = {}
+        self.masks = {}
+        self.active_keys = []
+
+    def clear(self):
+        for key in self.active_keys:
+            self.masks[key][:] = False
+        self.active_keys = []
+
+    def _get_array(self, key, values):
+        dtype = values.dtype if isinstance(values, np.ndarray) else np.dtype(object)
+        if key not in self.values:
+            self.values[key] = np.zeros(self.num_envs, dtype=dtype)
+            self.masks[key] = np.zeros(self.num_envs, dtype=bool)
+        else:
+            arr = self.values[key]
+            new_dtype = np.result_type(arr.dtype, dtype)
+            if new_dtype != arr.dtype:
+                # keeps the values already written this step
+                self.values[key] = arr.astype(new_dtype)
+        return self.values[key]
+
+    def add(self, idx_start, columns):
+        for key, (idxs, values) in columns.items():
+            arr = self._get_array(key, values)
+            if key not in self.active_keys:
+                arr[:] = None if arr.dtype == object else 0
+                self.active_keys.append(key)
+            if arr.dtype == object:
+                for i, value in zip(idxs, values):
+                    arr[idx_start + i] = value
+            else:
+                arr[idx_start + idxs] = values
+            self.masks[key][idx_start + idxs] = True
+
+    def get(self):
+        infos = {}
+        for key in self.active_keys:
+            infos[key] = self.values[key]
+            infos["_" + key] = self.masks[key]
+        return infos
+
+
+def columns_to_infos(num_envs, columns):
+    info_buffer = ColumnarInfoBuffer(num_envs)
+    info_buffer.add(0, columns)
+    return info_buffer.get()
@@ -0,0 +1,126 @@
+import math
+import os
+
+
+def available_cpus():
+    """
+    returns the cpus the current process is allowed to run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    import psutil
+
+    try:
+        return sorted(psutil.Process().cpu_affinity())
+    except AttributeError:
+        # platform does not support cpu affinities (e.g. macOS)
+        return list(range(psutil.cpu_count(logical=True)))
+
+
+def cgroup_cpu_limit():
+    """
+    returns the number of cpus the cgroup cpu quota allows this process to use,
+    or None if there is no quota.
+    """
+    try:
+        # cgroup v2
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota == "max":
+            return None
+        quota, period = int(quota), int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as file:
+                quota = int(file.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as file:
+                period = int(file.read())
+        except (OSError, ValueError):
+            return None
+        if quota <= 0:
+            return None
+    return max(1, math.ceil(quota / period))
+
+
+def _physical_core(cpu):
+    topology = f"/sys/devices/system/cpu/cpu{cpu}/topology/"
+    with open(topology + "physical_package_id") as file:
+        package = int(file.read())
+    with open(topology + "core_id") as file:
+        core = int(file.read())
+    return package, core
+
+
+def physical_cores_first(cpus):
+    """
+    orders cpus so that one logical cpu of every physical core comes before
+    any of their SMT siblings. Returns cpus unchanged if the topology is unknown.
+    """
+    cores = {}
+    try:
+        for cpu in cpus:
+            cores.setdefault(_physical_core(cpu), []).append(cpu)
+    except (OSError, ValueError):
+        return list(cpus)
+
+    siblings = list(cores.values())
+    ordered = []
+    for i in range(max(len(s) for s in siblings)):
+        ordered.extend(s[i] for s in siblings if i < len(s))
+    return ordered
+
+
+def worker_cpu_affinities(cpu_pinning, num_workers, cpus_per_worker=1):
+    """
+    returns the list of cpus each worker should be pinned to (None for no pinning).
+    With "spread" and "physical", every worker gets cpus_per_worker consecutive cpus
+    (e.g. one per thread of a ThreadedConcatVecEnv), fewer if there are not enough.
+
+    cpu_pinning can be:
+        - None or "none": workers are not pinned
+        - "spread": workers are spread over the cpus this process is allowed to run on
+        - "physical": like "spread", but uses every physical core before SMT siblings
+        - a list with one entry per worker (cycled if shorter), each either a cpu
+            index or a list of cpu indexes
+    """
+    if cpu_pinning is None or cpu_pinning == "none":
+        return [None] * num_workers
+    elif cpu_pinning in ("spread", "physical"):
+        cpus = available_cpus()
+        if cpu_pinning == "physical":
+            cpus = physical_cores_first(cpus)
+        cpu_limit = cgroup_cpu_limit()
+        if cpu_limit is not None:
+            cpus = cpus[:cpu_limit]
+        cpus_per_worker = min(cpus_per_worker, len(cpus))
+        return [
+            [
+                cpus[(i * cpus_per_worker + j) % len(cpus)]
+                for j in range(cpus_per_worker)
+            ]
+            for i in range(num_workers)
+        ]
+    elif isinstance(cpu_pinning, (list, tuple)):
+        assert len(cpu_pinning) > 0, "cpu_pinning list cannot be empty"
+        return [
+            list(cpus) if isinstance(cpus, (list, tuple)) else [cpus]
+            for cpus in (cpu_pinning[i % len(cpu_pinning)] for i in range(num_workers))
+        ]
+    else:
+        raise ValueError(
+            "cpu_pinning must be None, 'none', 'spread', 'physical' or a list of cpus"
+        )
+
+
+def set_cpu_affinity(cpus):
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    else:
+        import psutil
+
+        try:
+            psutil.Process().cpu_affinity(cpus)
+        except AttributeError:
+            # platform does not support cpu affinities (e.g. macOS)
+            pass
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def balanced_partition(costs, num_parts):
+    """
+    splits a list of costs into num_parts contiguous, non empty chunks whose
+    sums are as close as possible to equal.
+
+    returns the chunk boundaries: chunk i is costs[bounds[i] : bounds[i + 1]]
+    """
+    num_items = len(costs)
+    assert 0 < num_parts <= num_items
+    prefix = np.cumsum(costs, dtype=np.float64)
+    total = prefix[-1]
+    bounds = [0]
+    for k in range(1, num_parts):
+        target = total * k / num_parts
+        end = int(np.searchsorted(prefix, target)) + 1
+        # the chunk can also end one item earlier, if that is closer to the target
+        if end > 1 and target - prefix[end - 2] < prefix[end - 1] - target:
+            end -= 1
+        # every chunk needs at least one item
+        end = min(max(end, bounds[-1] + 1), num_items - (num_parts - k))
+        bounds.append(end)
+    bounds.append(num_items)
+    return bounds
+
+
+def max_chunk_cost(costs, bounds):
+    return max(
+        np.sum(costs[start:end], dtype=np.float64)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    )
@@ -1,25 +1,224 @@
+import ctypes
+import mmap
 import multiprocessing as mp
+import os
+import sys
+import weakref
+from multiprocessing import resource_tracker, shared_memory
 
 import numpy as np
+from gymnasium.spaces import Dict, Tuple
 
 
-class SharedArray:
-    def __init__(self, shape, dtype):
-        self.shared_arr = mp.Array(
-            np.ctypeslib.as_ctypes_type(dtype), int(np.prod(shape)), lock=False
+# byte alignment of every array in a shared buffer (one cache line)
+ALIGNMENT = 64
+BACKENDS = ("mp", "shm")
+
+
+def align(offset, alignment=ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class MPBuffer:
+    """
+    shared memory allocated with multiprocessing.RawArray. It can only be shared
+    with child processes when they are started.
+    """
+
+    def __init__(self, nbytes, hugepages=False):
+        # over allocates so the start of the buffer can be aligned
+        self.raw = mp.RawArray(ctypes.c_uint8, nbytes + ALIGNMENT)
+        self.start = -ctypes.addressof(self.raw) % ALIGNMENT
+        self.nbytes = nbytes
+
+    def as_numpy(self):
+        return np.frombuffer(
+            self.raw, dtype=np.uint8, count=self.nbytes, offset=self.start
         )
-        self.dtype = dtype
-        self.shape = shape
+
+
+class _SharedMemory(shared_memory.SharedMemory):
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # numpy views of the buffer are still alive, they keep the mapping open
+            pass
+
+
+def _unlink_if_owner(shm, owner_pid):
+    # forked children inherit the finalizer, but only the creator unlinks the segment
+    if os.getpid() == owner_pid:
+        if sys.version_info < (3, 13):
+            # processes attaching the segment may have unregistered it, which makes
+            # the tracker complain when unlink unregisters it again
+            resource_tracker.register(shm._name, "shared_memory")
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_shared_memory(name):
+    if sys.version_info >= (3, 13):
+        return _SharedMemory(name=name, track=False)
+    # before python 3.13, attaching registers the segment with the resource tracker,
+    # which would unlink it when a process not started by multiprocessing exits.
+    shm = _SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class ShmBuffer:
+    """
+    shared memory allocated with multiprocessing.shared_memory. It can be attached
+    by name from any process, including through a pipe after workers are started.
+    The segment is unlinked when the buffer of the process which created it is
+    garbage collected.
+
+    If hugepages is True, the kernel is asked to back the buffer with transparent
+    huge pages (only has an effect on linux, when shmem huge pages are enabled).
+    """
+
+    def __init__(self, nbytes, hugepages=False):
+        self.shm = _SharedMemory(create=True, size=max(nbytes, 1))
+        self.nbytes = nbytes
+        self.hugepages = hugepages
+        self._finalizer = weakref.finalize(
+            self, _unlink_if_owner, self.shm, os.getpid()
+        )
+        if hugepages:
+            self._madvise_hugepages()
+
+    def _madvise_hugepages(self):
+        if hasattr(mmap, "MADV_HUGEPAGE"):
+            try:
+                self.shm._mmap.madvise(mmap.MADV_HUGEPAGE)
+            except OSError:
+                pass
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def as_numpy(self):
+        return np.frombuffer(self.shm.buf, dtype=np.uint8, count=self.nbytes)
+
+    def __getstate__(self):
+        return (self.shm.name, self.nbytes, self.hugepages)
+
+    def __setstate__(self, state):
+        name, self.nbytes, self.hugepages = state
+        self.shm = _attach_shared_memory(name)
+        if self.hugepages:
+            self._madvise_hugepages()
+
+
+def create_buffer(nbytes, backend="mp", hugepages=False):
+    if backend == "mp":
+        return MPBuffer(nbytes, hugepages)
+    elif backend == "shm":
+        return ShmBuffer(nbytes, hugepages)
+    else:
+        raise ValueError(f"shared memory backend must be one of {BACKENDS}")
+
+
+class SharedArray:
+    """
+    numpy array in shared memory, which can be passed to worker processes.
+
+    parameters:
+        - backend: "mp" allocates with multiprocessing.RawArray, "shm" with
+            multiprocessing.shared_memory, which can be attached by name (e.g. sent
+            through a pipe) and is faster to allocate for large buffers.
+        - hugepages: asks for transparent huge pages ("shm" backend only)
+        - buffer, offset: places the array at offset bytes into an existing buffer
+            instead of allocating its own (see create_shared_arrays)
+    """
+
+    def __init__(
+        self, shape, dtype, backend="mp", hugepages=False, buffer=None, offset=0
+    ):
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        if buffer is None:
+            buffer = create_buffer(
+                int(np.prod(self.shape)) * self.dtype.itemsize, backend, hugepages
+            )
+        self.buffer = buffer
+        self.offset = offset
         self._set_np_arr()
 
     def _set_np_arr(self):
-        self.np_arr = np.frombuffer(self.shared_arr, dtype=self.dtype).reshape(
-            self.shape
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.np_arr = (
+            self.buffer.as_numpy()[self.offset : self.offset + nbytes]
+            .view(self.dtype)
+            .reshape(self.shape)
         )
 
     def __getstate__(self):
-        return (self.shared_arr, self.dtype, self.shape)
+        return (self.buffer, self.offset, self.dtype, self.shape)
 
     def __setstate__(self, state):
-        self.shared_arr, self.dtype, self.shape = state
+        self.buffer, self.offset, self.dtype, self.shape = state
         self._set_np_arr()
+
+
+def create_shared_arrays(fields, backend="mp", hugepages=False):
+    """
+    allocates a list of (shape, dtype) fields in a single shared buffer,
+    each starting at an ALIGNMENT byte aligned offset.
+    """
+    offsets = []
+    nbytes = 0
+    for shape, dtype in fields:
+        offsets.append(nbytes)
+        nbytes = align(nbytes + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    buffer = create_buffer(nbytes, backend, hugepages)
+    return [
+        SharedArray(shape, dtype, buffer=buffer, offset=offset)
+        for (shape, dtype), offset in zip(fields, offsets)
+    ]
+
+
+def _space_fields(space):
+    if isinstance(space, Dict):
+        return [field for s in space.spaces.values() for field in _space_fields(s)]
+    elif isinstance(space, Tuple):
+        return [field for s in space.spaces for field in _space_fields(s)]
+    else:
+        return [(space.shape, space.dtype)]
+
+
+def _space_tree(space, leaves):
+    if isinstance(space, Dict):
+        return {name: _space_tree(s, leaves) for name, s in space.spaces.items()}
+    elif isinstance(space, Tuple):
+        return tuple(_space_tree(s, leaves) for s in space.spaces)
+    else:
+        return next(leaves)
+
+
+def create_shared_space(space, n, backend="mp", hugepages=False):
+    """
+    allocates shared memory for n items of space, n being an int or a tuple of leading
+    dimensions. Returns SharedArrays with the structure of the space (dicts for Dict
+    spaces, tuples for Tuple spaces), all allocated in a single buffer.
+    """
+    lead = (n,) if isinstance(n, int) else tuple(n)
+    fields = [(lead + tuple(shape), dtype) for shape, dtype in _space_fields(space)]
+    arrays = create_shared_arrays(fields, backend, hugepages)
+    return _space_tree(space, iter(arrays))
+
+
+def shared_space_arrays(shared):
+    """
+    returns the numpy arrays of the SharedArrays created by create_shared_space
+    """
+    if isinstance(shared, dict):
+        return {name: shared_space_arrays(v) for name, v in shared.items()}
+    elif isinstance(shared, tuple):
+        return tuple(shared_space_arrays(v) for v in shared)
+    else:
+        return shared.np_arr
@@ -0,0 +1,25 @@
+import math
+
+import numpy as np
+
+
+def tile_images(frames, num_cols=None):
+    """
+    tiles a batch of frames of shape [N, H, W, C] into a single mosaic image of
+    shape [num_rows * H, num_cols * W, C]. Unused tiles of the grid are black.
+
+    parameters:
+        - num_cols: number of frames per row, defaults to a square grid
+    """
+    frames = np.asarray(frames)
+    num_frames, height, width, channels = frames.shape
+    if num_cols is None:
+        num_cols = math.ceil(math.sqrt(num_frames))
+    num_rows = math.ceil(num_frames / num_cols)
+    grid = np.zeros((num_rows * num_cols, height, width, channels), dtype=frames.dtype)
+    grid[:num_frames] = frames
+    return (
+        grid.reshape(num_rows, num_cols, height, width, channels)
+        .transpose(0, 2, 1, 3, 4)
+        .reshape(num_rows * height, num_cols * width, channels)
+    )
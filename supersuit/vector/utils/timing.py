@@ -0,0 +1,101 @@
+import time
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+
+from .shared_array import create_shared_arrays
+
+
+# phases of a step which are timed. pipe_recv is measured by the parent process,
+# from the moment a worker's reply is available until it is unpickled.
+PHASES = ("env_step", "shm_write", "info_pickle", "pipe_send", "pipe_recv")
+PHASE_INDEXES = {phase: i for i, phase in enumerate(PHASES)}
+# histogram bin edges in seconds, 4 bins per decade from 1 microsecond to 10 seconds
+BIN_EDGES = np.logspace(-6, 1, 29)
+
+
+class TimingStats:
+    """
+    per worker counters and histograms of the time spent in every phase of a step,
+    in shared memory. Every counter is written by a single process (the worker, or
+    the parent for pipe_recv), so they are updated without locks.
+    """
+
+    def __init__(self, num_workers, backend="mp", hugepages=False):
+        num_phases = len(PHASES)
+        self.totals, self.counts, self.histograms = create_shared_arrays(
+            [
+                ((num_workers, num_phases), np.float64),
+                ((num_workers, num_phases), np.int64),
+                ((num_workers, num_phases, len(BIN_EDGES) + 1), np.int64),
+            ],
+            backend,
+            hugepages,
+        )
+
+    def record(self, worker_idx, phase, start):
+        """
+        records the time elapsed since start (a time.perf_counter() value) in phase,
+        and returns the current time, so consecutive phases can be chained.
+        """
+        now = time.perf_counter()
+        elapsed = now - start
+        phase_idx = PHASE_INDEXES[phase]
+        self.totals.np_arr[worker_idx, phase_idx] += elapsed
+        self.counts.np_arr[worker_idx, phase_idx] += 1
+        bin_idx = np.searchsorted(BIN_EDGES, elapsed)
+        self.histograms.np_arr[worker_idx, phase_idx, bin_idx] += 1
+        return now
+
+    def send(self, pipe, obj, worker_idx, start=None):
+        """
+        pipe.send(obj), timing the pickling (from start, if given) and the sending
+        """
+        if start is None:
+            start = time.perf_counter()
+        data = ForkingPickler.dumps(obj)
+        start = self.record(worker_idx, "info_pickle", start)
+        pipe.send_bytes(data)
+        self.record(worker_idx, "pipe_send", start)
+
+    def recv(self, pipe, worker_idx):
+        """
+        pipe.recv(), timing it once the data is available
+        """
+        pipe.poll(None)
+        start = time.perf_counter()
+        data = pipe.recv()
+        self.record(worker_idx, "pipe_recv", start)
+        return data
+
+    def clear(self):
+        self.totals.np_arr[:] = 0
+        self.counts.np_arr[:] = 0
+        self.histograms.np_arr[:] = 0
+
+    def get_stats(self):
+        """
+        returns a dict mapping every phase to a dict of arrays with one row per worker:
+            - total: seconds spent in the phase
+            - count: number of times the phase was timed
+            - mean: mean seconds per call
+            - histogram: number of calls per duration bin, bin i holding durations
+                between BIN_EDGES[i - 1] and BIN_EDGES[i]
+
+        workers record sending a reply after it was sent, so the last reply of each
+        worker may not be counted yet. It is once the worker answered the next
+        instruction (e.g. after a reset).
+        """
+        totals = self.totals.np_arr.copy()
+        counts = self.counts.np_arr.copy()
+        histograms = self.histograms.np_arr.copy()
+        means = totals / np.maximum(counts, 1)
+        return {
+            phase: {
+                "total": totals[:, i],
+                "count": counts[:, i],
+                "mean": means[:, i],
+                "histogram": histograms[:, i],
+            }
+            for i, phase in enumerate(PHASES)
+        }
@@ -59,9 +59,36 @@ def stable_baselines3_vec_env_v0(env, num_envs, multiprocessing=False):
     return constructor(*args)
 
 
-def concat_vec_envs_v1(vec_env, num_vec_envs, num_cpus=0, base_class="gymnasium"):
+def concat_vec_envs_v1(
+    vec_env,
+    num_vec_envs,
+    num_cpus=0,
+    base_class="gymnasium",
+    return_copy=True,
+    info_mode="list",
+    cpu_pinning="spread",
+    respawn_workers=False,
+    load_balance=False,
+    max_macro_steps=0,
+    shared_memory_backend="mp",
+    hugepages=False,
+    num_threads=0,
+    timing_stats=False,
+):
     num_cpus = min(num_cpus, num_vec_envs)
-    vec_env = MakeCPUAsyncConstructor(num_cpus)(*vec_env_args(vec_env, num_vec_envs))
+    vec_env = MakeCPUAsyncConstructor(
+        num_cpus,
+        return_copy=return_copy,
+        info_mode=info_mode,
+        cpu_pinning=cpu_pinning,
+        respawn_workers=respawn_workers,
+        load_balance=load_balance,
+        max_macro_steps=max_macro_steps,
+        shared_memory_backend=shared_memory_backend,
+        hugepages=hugepages,
+        num_threads=num_threads,
+        timing_stats=timing_stats,
+    )(*vec_env_args(vec_env, num_vec_envs))
 
     if base_class == "gymnasium":
         return vec_env
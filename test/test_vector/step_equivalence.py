@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def sample_actions(venv):
+    return np.array([venv.action_space.sample() for _ in range(venv.num_envs)])
+
+
+def sample_aec_actions(vec_env):
+    act_space = vec_env.action_space(vec_env.agent_selection)
+    return [act_space.sample() for _ in range(vec_env.num_envs)]
+
+
+def assert_results_equal(results1, results2):
+    """
+    asserts that the observations, rewards, terminations and truncations which start
+    two step results (or two AEC vector env last() results) are equal
+    """
+    obs1, rew1, term1, trunc1 = results1[:4]
+    obs2, rew2, term2, trunc2 = results2[:4]
+    assert np.allclose(obs1, obs2)
+    assert np.allclose(rew1, rew2)
+    assert np.all(np.equal(term1, term2))
+    assert np.all(np.equal(trunc1, trunc2))
+
+
+def check_step_equivalency(venv1, venv2, num_steps=25):
+    """
+    resets two vector envs with the same seed, and checks that they step the same
+    """
+    obs1, _ = venv1.reset(seed=42)
+    obs2, _ = venv2.reset(seed=42)
+    assert np.all(np.equal(obs1, obs2))
+    for i in range(num_steps):
+        actions = sample_actions(venv1)
+        assert_results_equal(venv1.step(actions), venv2.step(actions))
+
+
+def check_aec_step_equivalency(vec_env1, vec_env2, num_steps=100):
+    """
+    resets two AEC vector envs with the same seed, and checks that they step the same
+    """
+    vec_env1.reset(seed=42)
+    vec_env2.reset(seed=42)
+    for i in range(num_steps):
+        assert vec_env1.agent_selection == vec_env2.agent_selection
+        last1 = vec_env1.last()
+        last2 = vec_env2.last()
+        assert_results_equal(last1, last2)
+        # passes
+        assert np.all(np.equal(last1[6], last2[6]))
+        actions = sample_aec_actions(vec_env1)
+        vec_env1.step(actions)
+        vec_env2.step(actions)
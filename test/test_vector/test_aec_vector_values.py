@@ -1,11 +1,20 @@
+import asyncio
 import random
+from test.test_vector.step_equivalence import (
+    assert_results_equal,
+    check_aec_step_equivalency,
+    sample_aec_actions,
+)
 
 import numpy as np
+import pytest
 from pettingzoo.butterfly import knights_archers_zombies_v10
-from pettingzoo.classic import rps_v2
+from pettingzoo.classic import connect_four_v3, rps_v2
 from pettingzoo.mpe import simple_world_comm_v3
+from pettingzoo.utils.wrappers import BaseWrapper
 
 from supersuit import vectorize_aec_env_v0
+from supersuit.aec_vector.async_vector_env import AsyncAECVectorEnv
 
 
 def test_all():
@@ -82,3 +91,244 @@ def test_all():
                 simple_world_comm_v3.env(), NUM_ENVS, num_cpus=num_cpus
             )
         )
+
+
+@pytest.mark.parametrize("shared_memory_backend", ["mp", "shm"])
+def test_async_sync_equivalency(shared_memory_backend):
+    NUM_ENVS = 4
+    for env_fn in [rps_v2.env, simple_world_comm_v3.env]:
+        env1 = vectorize_aec_env_v0(env_fn(), NUM_ENVS)
+        env2 = AsyncAECVectorEnv(
+            [env_fn] * NUM_ENVS,
+            num_cpus=2,
+            shared_memory_backend=shared_memory_backend,
+        )
+        try:
+            check_aec_step_equivalency(env1, env2)
+        finally:
+            env2.close()
+
+
+def test_async_io():
+    NUM_ENVS = 4
+    env1 = vectorize_aec_env_v0(rps_v2.env(), NUM_ENVS)
+    env2 = vectorize_aec_env_v0(rps_v2.env(), NUM_ENVS, num_cpus=2)
+
+    async def run():
+        env1.reset(seed=42)
+        await env2.reset_async_io(seed=42)
+        for i in range(20):
+            assert env1.agent_selection == env2.agent_selection
+            assert_results_equal(env1.last(), env2.last())
+            actions = sample_aec_actions(env1)
+            env1.step(actions)
+            await env2.step_async_io(actions)
+
+    try:
+        asyncio.run(run())
+    finally:
+        env2.close()
+
+
+def test_timing_stats():
+    NUM_ENVS = 4
+    env = AsyncAECVectorEnv([rps_v2.env] * NUM_ENVS, num_cpus=2, timing_stats=True)
+    try:
+        env.reset(seed=42)
+        for i in range(10):
+            act_space = env.action_space(env.agent_selection)
+            env.step([act_space.sample() for _ in range(NUM_ENVS)])
+        # counts the last step's reply, see TimingStats.get_stats
+        env.reset()
+        stats = env.get_timing_stats()
+        for phase in ["env_step", "shm_write", "info_pickle", "pipe_send", "pipe_recv"]:
+            assert np.all(stats[phase]["count"] == 10)
+            assert np.all(stats[phase]["histogram"].sum(axis=1) == 10)
+            assert np.all(stats[phase]["total"] > 0)
+    finally:
+        env.close()
+
+
+def test_fused_observe():
+    NUM_ENVS = 4
+    env1 = vectorize_aec_env_v0(rps_v2.env(), NUM_ENVS)
+    env2 = AsyncAECVectorEnv([rps_v2.env] * NUM_ENVS, num_cpus=2)
+    try:
+        env1.reset(seed=42)
+        env2.reset(seed=42)
+        for i in range(20):
+            # observations written by the step are read without an observe round trip
+            observe = i % 2 == 0
+            assert env2.observed_agent == (env2.agent_selection if observe else None)
+            assert np.all(np.equal(env1.last()[0], env2.last()[0]))
+            actions = sample_aec_actions(env1)
+            env1.step(actions)
+            env2.step(actions, observe=not observe)
+    finally:
+        env2.close()
+
+
+class LargeInfoEnv(BaseWrapper):
+    """
+    adds an array larger than a pipe's buffer to the infos
+    """
+
+    @property
+    def infos(self):
+        return {
+            agent: dict(info, large=np.ones(2**18))
+            for agent, info in self.env.infos.items()
+        }
+
+
+def large_info_env():
+    return LargeInfoEnv(rps_v2.env())
+
+
+def test_shared_sync_large_infos():
+    NUM_ENVS = 4
+    env = AsyncAECVectorEnv([large_info_env] * NUM_ENVS, num_cpus=2, sync_mode="shared")
+    try:
+        env.reset(seed=42)
+        for i in range(4):
+            act_space = env.action_space(env.agent_selection)
+            env.step([act_space.sample() for _ in range(NUM_ENVS)])
+            infos = env.infos[env.agent_selection]
+            assert all(info["large"].shape == (2**18,) for info in infos)
+    finally:
+        env.close()
+
+
+def test_shared_sync_dead_worker():
+    NUM_ENVS = 4
+    env = AsyncAECVectorEnv([rps_v2.env] * NUM_ENVS, num_cpus=2, sync_mode="shared")
+    try:
+        env.reset(seed=42)
+        env.procs[1].kill()
+        env.procs[1].join()
+        with pytest.raises(RuntimeError, match="worker 1 died"):
+            env.step(sample_aec_actions(env))
+    finally:
+        env.close()
+
+
+def test_shared_sync():
+    NUM_ENVS = 4
+    for env_fn in [rps_v2.env, simple_world_comm_v3.env]:
+        env1 = vectorize_aec_env_v0(env_fn(), NUM_ENVS)
+        env2 = AsyncAECVectorEnv([env_fn] * NUM_ENVS, num_cpus=2, sync_mode="shared")
+        try:
+            env1.reset(seed=42)
+            asyncio.run(env2.reset_async_io(seed=42))
+            for i in range(50):
+                assert env1.agent_selection == env2.agent_selection
+                last1 = env1.last()
+                last2 = env2.last()
+                assert_results_equal(last1, last2)
+                assert last1[-1] == last2[-1]
+                # observing another agent than the selected one
+                other_agent = env1.possible_agents[-1]
+                assert np.allclose(env1.observe(other_agent), env2.observe(other_agent))
+                actions = sample_aec_actions(env1)
+                env1.step(actions)
+                if i % 2 == 0:
+                    env2.step(actions)
+                else:
+                    asyncio.run(env2.step_async_io(actions))
+        finally:
+            env2.close()
+
+
+def test_dict_observations():
+    NUM_ENVS = 4
+    env1 = vectorize_aec_env_v0(connect_four_v3.env(), NUM_ENVS)
+    env2 = AsyncAECVectorEnv([connect_four_v3.env] * NUM_ENVS, num_cpus=2)
+    try:
+        env1.reset(seed=42)
+        env2.reset(seed=42)
+        for i in range(50):
+            assert env1.agent_selection == env2.agent_selection
+            obs = env2.last()[0]
+            assert obs["observation"].shape == (NUM_ENVS, 6, 7, 2)
+            assert obs["action_mask"].shape == (NUM_ENVS, 7)
+            for env, observation, action_mask in zip(
+                env1.envs, obs["observation"], obs["action_mask"]
+            ):
+                if env.agent_selection == env1.agent_selection:
+                    expected = env.observe(env1.agent_selection)
+                    assert np.all(np.equal(expected["observation"], observation))
+                    assert np.all(np.equal(expected["action_mask"], action_mask))
+            actions = [
+                np.flatnonzero(action_mask)[0] if action_mask.any() else 0
+                for action_mask in obs["action_mask"]
+            ]
+            env1.step(actions)
+            env2.step(actions)
+    finally:
+        env2.close()
+
+
+def test_sync_rows():
+    NUM_ENVS = 4
+    env = vectorize_aec_env_v0(simple_world_comm_v3.env(max_cycles=10), NUM_ENVS)
+    env.reset(seed=42)
+    for i in range(100):
+        obs, rew, term, trunc, _, _, _, infos = env.last()
+        for j, sub_env in enumerate(env.envs):
+            for agent in env.possible_agents:
+                assert np.isclose(env.rewards[agent][j], sub_env.rewards.get(agent, 0))
+                assert env.terminations[agent][j] == sub_env.terminations.get(
+                    agent, True
+                )
+            if env.agent_selection in sub_env.terminations:
+                assert np.all(obs[j] == sub_env.observe(env.agent_selection))
+        last_obs, last_rew = obs.copy(), rew.copy()
+        act_space = env.action_space(env.agent_selection)
+        env.step([act_space.sample() for _ in range(NUM_ENVS)])
+        # values returned by last are not overwritten by the step
+        assert np.array_equal(obs, last_obs)
+        assert np.array_equal(rew, last_rew)
+
+
+@pytest.mark.parametrize("sync_mode", ["pipe", "shared"])
+def test_grouped(sync_mode):
+    NUM_ENVS = 4
+    env1 = vectorize_aec_env_v0(connect_four_v3.env(), NUM_ENVS)
+    env2 = AsyncAECVectorEnv(
+        [connect_four_v3.env] * NUM_ENVS, num_cpus=2, sync_mode=sync_mode
+    )
+    rng = np.random.default_rng(42)
+    try:
+        env1.reset(seed=42)
+        env2.reset(seed=42)
+        num_groups = set()
+        for i in range(100):
+            data1 = env1.last_grouped()
+            agent_idxs, groups, obs, rew, term, trunc, _, _, infos = data1
+            data2 = env2.last_grouped(observe=i % 3 != 0)
+            assert np.all(agent_idxs == data2[0])
+            assert groups.keys() == data2[1].keys()
+            for data, data2_ in zip(data1[3:6], data2[3:6]):
+                assert np.allclose(data, data2_)
+            assert infos == data2[8]
+            num_groups.add(len(groups))
+
+            actions = {}
+            for agent, env_idxs in groups.items():
+                assert np.all(agent_idxs[env_idxs] == env1.agent_indexes[agent])
+                for j, env_idx in enumerate(env_idxs):
+                    expected = env1.envs[env_idx].observe(agent)
+                    for key in ["observation", "action_mask"]:
+                        assert np.all(obs[agent][key][j] == expected[key])
+                        if data2[2] is not None:
+                            assert np.all(data2[2][agent][key][j] == expected[key])
+                actions[agent] = [
+                    rng.choice(np.flatnonzero(mask)) if mask.any() else 0
+                    for mask in obs[agent]["action_mask"]
+                ]
+            env1.step_grouped(actions)
+            env2.step_grouped(actions, observe=i % 2 == 0)
+        # games end at different times, so environments select different agents
+        assert num_groups == {1, 2}
+    finally:
+        env2.close()
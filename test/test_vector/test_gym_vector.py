@@ -125,3 +125,89 @@ def test_multiproc_buffer():
         assert hash(str(keep_obs)) == hash(str(obss))
 
         obss = new_obss
+
+
+@pytest.mark.parametrize("num_cpus", [0, 2])
+def test_sync_batch_env(num_cpus):
+    num_envs = 2
+    venv = concat_vec_envs_v1(
+        gymnasium.make("CartPole-v1"), num_envs, num_cpus=num_cpus
+    )
+    envs = [gymnasium.make("CartPole-v1") for _ in range(num_envs)]
+    try:
+        obs, _ = venv.reset(seed=42)
+        # environments are seeded like separate environments would be
+        expected_obs = [env.reset(seed=42 + i)[0] for i, env in enumerate(envs)]
+        assert np.allclose(obs, expected_obs)
+        num_dones = 0
+        for i in range(100):
+            actions = np.array([venv.action_space.sample() for _ in range(num_envs)])
+            obs, rews, terms, truncs, infos = venv.step(actions)
+            for j, env in enumerate(envs):
+                env_obs, env_rew, env_term, env_trunc, _ = env.step(actions[j])
+                assert rews[j] == env_rew
+                assert terms[j] == env_term and truncs[j] == env_trunc
+                if env_term or env_trunc:
+                    # reset in the same step, with the last observation in the infos
+                    num_dones += 1
+                    assert np.allclose(infos[j]["terminal_observation"], env_obs)
+                    env_obs, _ = env.reset()
+                assert np.allclose(obs[j], env_obs)
+        assert num_dones > 0
+    finally:
+        venv.close()
+
+
+class PointGoalEnv(gymnasium.Env):
+    """
+    goal environment following the gymnasium robotics GoalEnv interface
+    """
+
+    observation_space = gymnasium.spaces.Dict(
+        {
+            "observation": gymnasium.spaces.Box(-1, 1, (2,)),
+            "achieved_goal": gymnasium.spaces.Box(-1, 1, (2,)),
+            "desired_goal": gymnasium.spaces.Box(-1, 1, (2,)),
+        }
+    )
+    action_space = gymnasium.spaces.Box(-0.1, 0.1, (2,))
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        self.pos = np.zeros(2, dtype=np.float32)
+        self.goal = self.np_random.uniform(-1, 1, 2).astype(np.float32)
+        return self._obs(), {}
+
+    def step(self, action):
+        self.pos = np.clip(self.pos + action, -1, 1).astype(np.float32)
+        reward = self.compute_reward(self.pos, self.goal, {})
+        return self._obs(), reward, False, False, {}
+
+    def _obs(self):
+        return {
+            "observation": self.pos,
+            "achieved_goal": self.pos,
+            "desired_goal": self.goal,
+        }
+
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        return -np.linalg.norm(achieved_goal - desired_goal, axis=-1)
+
+
+@pytest.mark.parametrize("num_cpus", [0, 2])
+def test_goal_env_compute_reward(num_cpus):
+    env = gymnasium.wrappers.TimeLimit(PointGoalEnv(), 10)
+    venv = concat_vec_envs_v1(env, 4, num_cpus=num_cpus)
+    try:
+        rng = np.random.default_rng(0)
+        achieved_goal = rng.random((100, 2))
+        desired_goal = rng.random((100, 2))
+        infos = np.array([{} for _ in range(100)])
+        expected = -np.linalg.norm(achieved_goal - desired_goal, axis=-1)
+        rewards = venv.env_method(
+            "compute_reward", achieved_goal, desired_goal, infos, indices=[0]
+        )[0]
+        assert rewards.dtype == np.float64
+        assert np.allclose(rewards, expected)
+    finally:
+        venv.close()
@@ -0,0 +1,633 @@
+import asyncio
+import os
+import pickle
+import time
+from contextlib import nullcontext
+from test.test_vector.step_equivalence import (
+    assert_results_equal,
+    check_step_equivalency,
+    sample_actions,
+)
+from test.test_vector.test_vector_dict import dict_vec_env_test
+from test.test_vector.test_vector_dict import make_env as make_dict_env
+
+import numpy as np
+import pytest
+from gymnasium.spaces import Box, Dict, Discrete
+from pettingzoo.mpe import simple_spread_v3
+from pettingzoo.utils.wrappers import BaseParallelWrapper
+
+from supersuit import concat_vec_envs_v1, pettingzoo_env_to_vec_env_v1
+from supersuit.vector import (
+    ConcatVecEnv,
+    MakeCPUAsyncConstructor,
+    MarkovVectorEnv,
+    ProcConcatVec,
+    ThreadedConcatVecEnv,
+)
+from supersuit.vector.utils import cpu_affinity
+from supersuit.vector.utils.columnar_info import ColumnarInfoBuffer, infos_to_columns
+from supersuit.vector.utils.cpu_affinity import (
+    available_cpus,
+    physical_cores_first,
+    worker_cpu_affinities,
+)
+from supersuit.vector.utils.load_balance import balanced_partition
+from supersuit.vector.utils.shared_array import (
+    ALIGNMENT,
+    SharedArray,
+    create_shared_space,
+)
+from supersuit.vector.utils.tile_images import tile_images
+
+
+def make_env():
+    env = simple_spread_v3.parallel_env(max_cycles=10)
+    return pettingzoo_env_to_vec_env_v1(env)
+
+
+def test_multiproc_single_proc_equivalency():
+    num_envs = 2
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=0)
+    venv2 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_envs)
+    try:
+        check_step_equivalency(venv1, venv2)
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def test_multiproc_dict_actions():
+    env = pettingzoo_env_to_vec_env_v1(make_dict_env())
+    venv = concat_vec_envs_v1(env, 2, num_cpus=2)
+    try:
+        dict_vec_env_test(venv)
+    finally:
+        venv.close()
+
+
+def test_multiproc_no_copy_double_buffering():
+    num_envs = 2
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_envs)
+    venv2 = concat_vec_envs_v1(
+        make_env(), num_envs, num_cpus=num_envs, return_copy=False
+    )
+    try:
+        obs1, _ = venv1.reset(seed=42)
+        obs2, _ = venv2.reset(seed=42)
+        assert np.all(np.equal(obs1, obs2))
+        prev_obs = prev_obs_copy = None
+        for i in range(25):
+            actions = sample_actions(venv1)
+            results2 = venv2.step(actions)
+            assert_results_equal(venv1.step(actions), results2)
+            obs2, _, term2, trunc2, _ = results2
+            assert term2.dtype == bool and trunc2.dtype == bool
+            # the previous step's buffers are not overwritten by this step
+            if prev_obs is not None:
+                assert np.all(np.equal(prev_obs, prev_obs_copy))
+                assert not np.shares_memory(prev_obs, obs2)
+            prev_obs, prev_obs_copy = obs2, obs2.copy()
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def test_columnar_info_buffer():
+    info_buffer = ColumnarInfoBuffer(4)
+    info_buffer.add(0, infos_to_columns([{"a": 1}, {"a": 2, "b": "x"}]))
+    info_buffer.add(2, infos_to_columns([{}, {"a": 0.5}]))
+    infos = info_buffer.get()
+    assert np.allclose(infos["a"], [1, 2, 0, 0.5])
+    assert np.all(infos["_a"] == [True, True, False, True])
+    assert list(infos["b"]) == [None, "x", None, None]
+    assert np.all(infos["_b"] == [False, True, False, False])
+
+    info_buffer.clear()
+    info_buffer.add(0, infos_to_columns([{}, {}, {"a": 3}, {}]))
+    infos = info_buffer.get()
+    assert set(infos.keys()) == {"a", "_a"}
+    assert np.allclose(infos["a"], [0, 0, 3, 0])
+    assert np.all(infos["_a"] == [False, False, True, False])
+
+
+def test_multiproc_dict_infos():
+    num_envs = 2
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=0, info_mode="dict")
+    venv2 = concat_vec_envs_v1(
+        make_env(), num_envs, num_cpus=num_envs, info_mode="dict"
+    )
+    try:
+        _, infos1 = venv1.reset(seed=42)
+        _, infos2 = venv2.reset(seed=42)
+        assert infos1 == {} and infos2 == {}
+        for i in range(25):
+            actions = sample_actions(venv1)
+            _, _, term, trunc, infos1 = venv1.step(actions)
+            _, _, _, _, infos2 = venv2.step(actions)
+            assert set(infos1.keys()) == set(infos2.keys())
+            if np.any(term | trunc):
+                assert np.all(infos2["_terminal_observation"] == (term | trunc))
+                for obs1, obs2 in zip(
+                    infos1["terminal_observation"], infos2["terminal_observation"]
+                ):
+                    assert np.allclose(obs1, obs2)
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def test_multiproc_send_recv():
+    num_envs = 2
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=0)
+    venv2 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_envs)
+    try:
+        venv1.reset(seed=42)
+        venv2.reset(seed=42)
+        for i in range(10):
+            actions = sample_actions(venv1)
+            venv2.send(actions)
+            results2 = venv2.recv(venv2.num_envs)
+            assert np.all(results2[-1] == np.arange(venv2.num_envs))
+            assert_results_equal(venv1.step(actions), results2)
+
+        # partial batches
+        worker_envs = np.arange(venv2.idx_starts[1], venv2.idx_starts[2])
+        venv2.send(actions[worker_envs], worker_envs)
+        obs, rew, _, _, infos, env_ids = venv2.recv()
+        assert np.all(env_ids == worker_envs)
+        assert len(obs) == len(rew) == len(infos) == len(worker_envs)
+
+        venv2.send(actions)
+        received = []
+        while venv2.pending_workers:
+            received.extend(venv2.recv()[-1])
+        assert sorted(received) == list(range(venv2.num_envs))
+
+        with pytest.raises(AssertionError):
+            venv2.send(actions[:1], [0])
+
+        # other instructions would be answered before the pending steps
+        venv2.send(actions)
+        for method in [venv2.reset, venv2.render, venv2.render_all]:
+            with pytest.raises(AssertionError, match="send()"):
+                method()
+        with pytest.raises(AssertionError, match="send()"):
+            venv2.step_many([actions])
+        venv2.recv(venv2.num_envs)
+        venv2.reset()
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def test_cpu_pinning():
+    cpus = available_cpus()
+    assert worker_cpu_affinities(None, 3) == [None] * 3
+    assert worker_cpu_affinities("none", 3) == [None] * 3
+    for policy in ["spread", "physical"]:
+        affinities = worker_cpu_affinities(policy, 2 * len(cpus))
+        assert len(affinities) == 2 * len(cpus)
+        assert all(len(a) == 1 and a[0] in cpus for a in affinities)
+    assert sorted(physical_cores_first(cpus)) == cpus
+    assert worker_cpu_affinities([0, [0, 1]], 3) == [[0], [0, 1], [0]]
+    with pytest.raises(ValueError):
+        worker_cpu_affinities("bad", 3)
+
+    venv = concat_vec_envs_v1(make_env(), 2, num_cpus=2, cpu_pinning=[cpus[-1]])
+    try:
+        venv.reset()
+    finally:
+        venv.close()
+
+
+def test_cpu_pinning_threads(monkeypatch):
+    monkeypatch.setattr(cpu_affinity, "available_cpus", lambda: [0, 1, 2, 3])
+    monkeypatch.setattr(cpu_affinity, "cgroup_cpu_limit", lambda: None)
+    assert worker_cpu_affinities("spread", 2, 2) == [[0, 1], [2, 3]]
+    assert worker_cpu_affinities("spread", 3, 2) == [[0, 1], [2, 3], [0, 1]]
+    assert worker_cpu_affinities("spread", 1, 8) == [[0, 1, 2, 3]]
+    monkeypatch.undo()
+
+    # every thread of a worker gets its own cpu
+    cpus = available_cpus()
+    venv = concat_vec_envs_v1(make_env(), 4, num_cpus=2, num_threads=2)
+    try:
+        assert len(venv.worker_cpus) == 2
+        for worker_cpus in venv.worker_cpus:
+            assert len(set(worker_cpus)) == min(2, len(cpus))
+            assert set(worker_cpus) <= set(cpus)
+        venv.reset()
+    finally:
+        venv.close()
+
+
+class CrashingVecEnv(MarkovVectorEnv):
+    def __init__(self, par_env, crash_at, hard_crash):
+        super().__init__(par_env)
+        self.crash_at = crash_at
+        self.hard_crash = hard_crash
+        self.num_steps = 0
+
+    def step(self, actions):
+        self.num_steps += 1
+        if self.num_steps == self.crash_at:
+            if self.hard_crash:
+                os._exit(1)
+            raise RuntimeError("env crashed")
+        return super().step(actions)
+
+
+@pytest.mark.parametrize("hard_crash", [False, True])
+def test_multiproc_respawn_workers(hard_crash):
+    env = CrashingVecEnv(simple_spread_v3.parallel_env(), 3, hard_crash)
+    venv = concat_vec_envs_v1(env, 2, num_cpus=2, respawn_workers=True)
+    try:
+        venv.reset(seed=42)
+        for i in range(1, 6):
+            actions = [venv.action_space.sample() for _ in range(venv.num_envs)]
+            if i == 3:
+                with pytest.warns(UserWarning, match="crashed"):
+                    _, rews, terms, truncs, infos = venv.step(actions)
+                assert np.all(truncs) and not np.any(terms)
+                assert all(info["worker_respawned"] for info in infos)
+            else:
+                _, rews, terms, truncs, infos = venv.step(actions)
+                assert not np.any(truncs)
+                assert not any("worker_respawned" in info for info in infos)
+    finally:
+        venv.close()
+
+    venv = concat_vec_envs_v1(env, 2, num_cpus=2)
+    try:
+        venv.reset(seed=42)
+        with pytest.raises(Exception):
+            for i in range(3):
+                venv.step([venv.action_space.sample() for _ in range(venv.num_envs)])
+    finally:
+        venv.close()
+
+
+class SlowVecEnv(MarkovVectorEnv):
+    def step(self, actions):
+        time.sleep(0.002)
+        return super().step(actions)
+
+
+def test_balanced_partition():
+    assert balanced_partition([1, 1, 1, 1], 2) == [0, 2, 4]
+    assert balanced_partition([3, 1, 1, 1], 2) == [0, 1, 4]
+    assert balanced_partition([1, 1, 1, 10], 3) == [0, 2, 3, 4]
+    assert balanced_partition([0, 0, 0], 3) == [0, 1, 2, 3]
+
+
+def test_multiproc_load_balance():
+    def slow_env_fn():
+        return SlowVecEnv(simple_spread_v3.parallel_env())
+
+    def fast_env_fn():
+        return make_env()
+
+    example_env = make_env()
+    venv = MakeCPUAsyncConstructor(2, load_balance=True)(
+        [slow_env_fn] * 3 + [fast_env_fn] * 3,
+        example_env.observation_space,
+        example_env.action_space,
+    )
+    try:
+        venv.reset(seed=42)
+        assert venv.idx_starts == [0, 9, 18]
+        for i in range(101):
+            venv.step([venv.action_space.sample() for _ in range(venv.num_envs)])
+        venv.reset(seed=42)
+        assert venv.idx_starts == [0, 6, 18]
+        for i in range(5):
+            obs, rews, _, _, infos = venv.step(
+                [venv.action_space.sample() for _ in range(venv.num_envs)]
+            )
+            assert len(obs) == len(rews) == len(infos) == venv.num_envs
+    finally:
+        venv.close()
+
+
+def test_multiproc_step_many():
+    num_envs = 2
+    num_steps = 4
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_envs)
+    venv2 = concat_vec_envs_v1(
+        make_env(), num_envs, num_cpus=num_envs, max_macro_steps=num_steps
+    )
+    try:
+        venv1.reset(seed=42)
+        venv2.reset(seed=42)
+        for i in range(4):
+            action_sequence = np.array(
+                [sample_actions(venv1) for _ in range(num_steps)]
+            )
+            results2 = venv2.step_many(action_sequence)
+            infos2 = results2[4]
+            assert results2[0].shape[:2] == (num_steps, venv2.num_envs)
+            assert len(infos2) == num_steps
+            for k in range(num_steps):
+                results1 = venv1.step(action_sequence[k])
+                assert_results_equal(results1, [res[k] for res in results2])
+                assert [info.keys() for info in results1[4]] == [
+                    info.keys() for info in infos2[k]
+                ]
+
+        # list of action batches, shorter than max_macro_steps
+        obs, rews, _, _, infos = venv2.step_many(list(action_sequence[:2]))
+        assert obs.shape[0] == rews.shape[0] == len(infos) == 2
+        with pytest.raises(AssertionError):
+            venv2.step_many(np.concatenate([action_sequence, action_sequence]))
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+@pytest.mark.parametrize("backend", ["mp", "shm"])
+def test_shared_array_backends(backend):
+    space = Dict({"a": Box(0, 1, (3,)), "b": Discrete(5)})
+    shared = create_shared_space(space, 7, backend)
+    assert shared["a"].np_arr.shape == (7, 3) and shared["b"].np_arr.shape == (7,)
+    assert shared["a"].buffer is shared["b"].buffer
+    for arr in (shared["a"].np_arr, shared["b"].np_arr):
+        assert arr.ctypes.data % ALIGNMENT == 0
+
+    if backend == "shm":
+        # shm arrays can be attached by name, e.g. after pickling
+        arr = SharedArray((2, 3), np.int32, backend, hugepages=True)
+        attached = pickle.loads(pickle.dumps(arr))
+        attached.np_arr[:] = 4
+        assert np.all(arr.np_arr == 4)
+
+    venv1 = concat_vec_envs_v1(make_env(), 2, num_cpus=0)
+    venv2 = concat_vec_envs_v1(make_env(), 2, num_cpus=2, shared_memory_backend=backend)
+    try:
+        check_step_equivalency(venv1, venv2, num_steps=1)
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def slow_make_env():
+    time.sleep(1)
+    return make_env()
+
+
+def test_worker_options_without_workers():
+    # options of the worker processes are not silently dropped without workers
+    with pytest.raises(ValueError, match="max_macro_steps, timing_stats"):
+        concat_vec_envs_v1(
+            make_env(), 2, num_cpus=0, max_macro_steps=3, timing_stats=True
+        )
+    with pytest.raises(ValueError, match="respawn_workers"):
+        concat_vec_envs_v1(make_env(), 1, num_cpus=2, respawn_workers=True)
+
+
+def test_multiproc_parallel_startup():
+    start = time.perf_counter()
+    venv = ProcConcatVec(
+        [slow_make_env] * 4, None, None, None, None, shared_memory_backend="shm"
+    )
+    try:
+        # workers build their environments at the same time
+        assert time.perf_counter() - start < 3
+        example_env = make_env()
+        assert venv.observation_space == example_env.observation_space
+        assert venv.action_space == example_env.action_space
+        assert venv.metadata == example_env.metadata
+        assert venv.num_envs == 4 * example_env.num_envs
+        obs, _ = venv.reset(seed=42)
+        assert len(obs) == venv.num_envs
+    finally:
+        venv.close()
+
+    with pytest.raises(ValueError):
+        ProcConcatVec([make_env], None, None, None, None)
+
+
+def test_concat_vec_env_obs_buffer():
+    venv1 = ConcatVecEnv([make_env] * 2)
+    venv2 = ConcatVecEnv([make_env] * 2)
+    obs_buffer = np.zeros(
+        (venv2.num_envs,) + venv2.observation_space.shape,
+        dtype=venv2.observation_space.dtype,
+    )
+    venv2.set_obs_buffer(obs_buffer)
+    obs1, _ = venv1.reset(seed=42)
+    obs2, _ = venv2.reset(seed=42)
+    assert obs2 is obs_buffer and np.all(obs1 == obs2)
+    actions = [venv1.action_space.sample() for _ in range(venv1.num_envs)]
+    obs1 = venv1.step(actions)[0]
+    obs2 = venv2.step(actions)[0]
+    assert obs2 is obs_buffer and np.allclose(obs1, obs2)
+
+
+def test_concat_vec_env_batched_actions():
+    venv1 = ConcatVecEnv([make_env] * 2)
+    venv2 = ConcatVecEnv([make_env] * 2)
+    obs1, _ = venv1.reset(seed=42)
+    venv2.reset(seed=42)
+    for i in range(5):
+        actions = [venv1.action_space.sample() for _ in range(venv1.num_envs)]
+        # actions given as a list of items or as a batch are stepped the same
+        next_obs1, rew1, _, _, _ = venv1.step(actions)
+        next_obs2, rew2, _, _, _ = venv2.step(np.array(actions))
+        assert np.allclose(next_obs1, next_obs2) and np.allclose(rew1, rew2)
+        # returned observations are not overwritten by later steps
+        assert next_obs1 is not obs1 and not np.shares_memory(next_obs1, obs1)
+        obs1 = next_obs1
+
+
+@pytest.mark.parametrize("num_cpus", [0, 2])
+def test_threaded_concat_vec_env(num_cpus):
+    num_envs = 4
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_cpus)
+    venv2 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_cpus, num_threads=2)
+    if num_cpus == 0:
+        assert isinstance(venv2, ThreadedConcatVecEnv)
+    try:
+        check_step_equivalency(venv1, venv2)
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+def test_multiproc_async_io():
+    num_envs = 2
+    venv1 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_envs)
+    venv2 = concat_vec_envs_v1(make_env(), num_envs, num_cpus=num_envs)
+
+    async def run():
+        obs1, _ = venv1.reset(seed=42)
+        obs2, _ = await venv2.reset_async_io(seed=42)
+        assert np.all(np.equal(obs1, obs2))
+        for i in range(10):
+            actions = sample_actions(venv1)
+            # other coroutines keep running while the workers step
+            ticks = []
+            step = asyncio.ensure_future(venv2.step_async_io(actions))
+            while not step.done():
+                ticks.append(i)
+                await asyncio.sleep(0)
+            assert ticks
+            assert_results_equal(venv1.step(actions), step.result())
+
+    try:
+        asyncio.run(run())
+    finally:
+        venv1.close()
+        venv2.close()
+
+
+@pytest.mark.parametrize("num_cpus", [0, 2])
+def test_render_all(num_cpus):
+    num_vec_envs = 4
+    # workers render into a shared buffer with the "shm" backend
+    backend = "shm" if num_cpus else "mp"
+    venv = concat_vec_envs_v1(
+        make_render_env(),
+        num_vec_envs,
+        num_cpus=num_cpus,
+        shared_memory_backend=backend,
+    )
+    try:
+        venv.reset(seed=42)
+        frames = venv.render_all()
+        assert frames.ndim == 4 and len(frames) == num_vec_envs
+        assert frames.dtype == np.uint8
+        venv.step(np.array([venv.action_space.sample() for _ in range(venv.num_envs)]))
+        # rendered into the shared buffer after the first call
+        frames = venv.render_all()
+        assert len(frames) == num_vec_envs
+        assert np.all(np.equal(frames[0], venv.render()))
+    finally:
+        venv.close()
+
+
+def make_render_env():
+    env = simple_spread_v3.parallel_env(max_cycles=10, render_mode="rgb_array")
+    return pettingzoo_env_to_vec_env_v1(env)
+
+
+def make_crashing_render_env():
+    env = simple_spread_v3.parallel_env(max_cycles=10, render_mode="rgb_array")
+    return CrashingVecEnv(env, 3, False)
+
+
+def test_render_all_after_respawn():
+    example_env = make_render_env()
+    # only the first worker crashes
+    venv = MakeCPUAsyncConstructor(
+        2, respawn_workers=True, shared_memory_backend="shm"
+    )(
+        [make_crashing_render_env, make_render_env],
+        example_env.observation_space,
+        example_env.action_space,
+    )
+    try:
+        venv.reset(seed=42)
+        venv.render_all()
+        for i in range(1, 4):
+            actions = [venv.action_space.sample() for _ in range(venv.num_envs)]
+            with pytest.warns(
+                UserWarning, match="crashed"
+            ) if i == 3 else nullcontext():
+                venv.step(actions)
+        # the restarted worker renders into the same shared buffer
+        frames = venv.render_all()
+        assert len(frames) == 2
+        assert np.all(np.equal(frames[0], venv.render()))
+    finally:
+        venv.close()
+
+
+def test_tile_images():
+    frames = np.arange(5 * 2 * 3 * 3, dtype=np.uint8).reshape(5, 2, 3, 3)
+    mosaic = tile_images(frames)
+    assert mosaic.shape == (2 * 2, 3 * 3, 3)
+    assert np.all(np.equal(mosaic[:2, 3:6], frames[1]))
+    assert np.all(np.equal(mosaic[2:, :3], frames[3]))
+    assert np.all(mosaic[2:, 6:] == 0)
+    assert tile_images(frames, num_cols=5).shape == (2, 5 * 3, 3)
+
+
+class GoalEnv(BaseParallelWrapper):
+    def compute_reward(self, achieved_goal, desired_goal, info):
+        return -np.linalg.norm(achieved_goal - desired_goal, axis=-1)
+
+
+def make_goal_env():
+    return MarkovVectorEnv(GoalEnv(simple_spread_v3.parallel_env(max_cycles=10)))
+
+
+@pytest.mark.parametrize("backend", ["mp", "shm"])
+def test_compute_reward(backend):
+    example_env = make_goal_env()
+    venv = MakeCPUAsyncConstructor(2, shared_memory_backend=backend)(
+        [make_goal_env] * 4,
+        example_env.observation_space,
+        example_env.action_space,
+    )
+    try:
+        rng = np.random.default_rng(0)
+        for batch_size in [1, 1000, 10]:
+            achieved_goal = rng.random((batch_size, 3))
+            desired_goal = rng.random((batch_size, 3))
+            infos = np.array([{} for _ in range(batch_size)])
+            expected = -np.linalg.norm(achieved_goal - desired_goal, axis=-1)
+            rewards = venv.env_method(
+                "compute_reward", achieved_goal, desired_goal, infos, indices=[0]
+            )[0]
+            assert rewards.shape == (batch_size,) and rewards.dtype == np.float64
+            assert np.allclose(rewards, expected, atol=1e-6)
+
+        venv.set_compute_reward_fn(
+            lambda achieved, desired, info: -np.ones(len(achieved))
+        )
+        assert np.all(venv.compute_reward(achieved_goal, desired_goal, infos) == -1)
+    finally:
+        venv.close()
+
+
+def test_timing_stats():
+    venv = concat_vec_envs_v1(make_env(), 2, num_cpus=2, timing_stats=True)
+    try:
+        venv.reset(seed=42)
+        for i in range(10):
+            venv.step(
+                np.array([venv.action_space.sample() for _ in range(venv.num_envs)])
+            )
+        # counts the last step's reply, see TimingStats.get_stats
+        venv.reset()
+        stats = venv.get_timing_stats()
+        for phase in ["env_step", "shm_write", "info_pickle", "pipe_send", "pipe_recv"]:
+            assert np.all(stats[phase]["count"] == 10)
+            assert np.all(stats[phase]["histogram"].sum(axis=1) == 10)
+            assert np.all(stats[phase]["total"] > 0)
+            assert np.allclose(
+                stats[phase]["mean"], stats[phase]["total"] / stats[phase]["count"]
+            )
+    finally:
+        venv.close()
+
+
+def test_step_many_timing_stats():
+    num_steps = 3
+    venv = concat_vec_envs_v1(
+        make_env(), 2, num_cpus=2, timing_stats=True, max_macro_steps=num_steps
+    )
+    try:
+        venv.reset(seed=42)
+        for i in range(4):
+            venv.step_many([sample_actions(venv) for _ in range(num_steps)])
+        venv.reset()
+        stats = venv.get_timing_stats()
+        # every step is timed, but there is a single reply per step_many call
+        for phase in ["env_step", "shm_write"]:
+            assert np.all(stats[phase]["count"] == 4 * num_steps)
+        for phase in ["info_pickle", "pipe_send", "pipe_recv"]:
+            assert np.all(stats[phase]["count"] == 4)
+    finally:
+        venv.close()
@@ -2,10 +2,13 @@ import copy
 
 import numpy as np
 import pytest
+from gymnasium.spaces import Box, Discrete
 from pettingzoo.butterfly import knights_archers_zombies_v10
 from pettingzoo.mpe import simple_spread_v3, simple_world_comm_v3
+from pettingzoo.utils import ParallelEnv
 
 from supersuit import black_death_v3, concat_vec_envs_v1, pettingzoo_env_to_vec_env_v1
+from supersuit.vector import MarkovVectorEnv
 
 
 def test_good_env():
@@ -65,6 +68,28 @@ def test_good_vecenv():
         obss = new_obss
 
 
+def test_agent_rows():
+    par_env = simple_spread_v3.parallel_env(max_cycles=10)
+    venv = pettingzoo_env_to_vec_env_v1(simple_spread_v3.parallel_env(max_cycles=10))
+    par_obs, _ = par_env.reset(seed=42)
+    obs, _ = venv.reset(seed=42)
+    for i in range(9):
+        for row, agent in enumerate(par_env.possible_agents):
+            assert np.all(obs[row] == par_obs[agent])
+        actions = np.array([venv.action_space.sample() for _ in range(venv.num_envs)])
+        par_obs, par_rews, par_terms, par_truncs, _ = par_env.step(
+            dict(zip(par_env.possible_agents, actions))
+        )
+        prev_obs = obs
+        obs, rews, terms, truncs, _ = venv.step(actions)
+        for row, agent in enumerate(par_env.possible_agents):
+            assert rews[row] == np.float32(par_rews[agent])
+            assert terms[row] == par_terms[agent]
+            assert truncs[row] == par_truncs[agent]
+        # batches are returned as copies of the preallocated buffers
+        assert not np.shares_memory(obs, prev_obs)
+
+
 def test_bad_action_spaces_env():
     env = simple_world_comm_v3.parallel_env()
     with pytest.raises(AssertionError):
@@ -92,7 +117,81 @@ def test_env_black_death_wrapper():
         obss, rews, terms, truncs, infos = env.step(actions)
 
 
-def test_terminal_obs_are_returned():
+class DyingAgentsEnv(ParallelEnv):
+    """
+    agent_0 dies in step 1, agent_1 in step 2, the episode ends after 4 steps
+    """
+
+    metadata = {}
+
+    def __init__(self):
+        self.possible_agents = [f"agent_{i}" for i in range(3)]
+        self.render_mode = None
+
+    def observation_space(self, agent):
+        return Box(0, 10, (2,))
+
+    def action_space(self, agent):
+        return Discrete(2)
+
+    def reset(self, seed=None, options=None):
+        self.num_steps = 0
+        self.agents = self.possible_agents[:]
+        return {agent: self.observe(agent) for agent in self.agents}, {}
+
+    def observe(self, agent):
+        return np.array([self.num_steps, int(agent[-1])], dtype=np.float32)
+
+    def step(self, actions):
+        self.num_steps += 1
+        obs = {agent: self.observe(agent) for agent in self.agents}
+        rews = {agent: 1.0 for agent in self.agents}
+        truncs = {agent: self.num_steps >= 4 for agent in self.agents}
+        terms = {agent: self.num_steps == int(agent[-1]) + 1 for agent in self.agents}
+        terms["agent_2"] = False
+        infos = {agent: {} for agent in self.agents}
+        self.agents = [agent for agent in self.agents if not terms[agent]]
+        return obs, rews, terms, truncs, infos
+
+
+def test_active_mask():
+    env = MarkovVectorEnv(DyingAgentsEnv(), active_mask=True)
+    obss, _ = env.reset()
+    assert np.all(env.active_mask)
+    for num_steps in range(1, 4):
+        obss, rews, terms, truncs, infos = env.step(np.zeros(3, dtype=np.int64))
+        # agents are active in the step they die
+        expected_active = np.array([num_steps <= 1, num_steps <= 2, True])
+        assert np.all(env.active_mask == expected_active)
+        assert np.all(env.active_mask == [info.get("active", True) for info in infos])
+        # dead agents keep their last observation
+        assert np.all(obss[:, 0] == np.where(expected_active, num_steps, [1, 2, 0]))
+        assert np.all(rews == expected_active)
+    obss, rews, terms, truncs, infos = env.step(np.zeros(3, dtype=np.int64))
+    # the episode ended and was reset
+    assert truncs[2] and np.all(env.active_mask)
+    assert np.all(obss[:, 0] == 0)
+
+
+class LateAgentEnv(DyingAgentsEnv):
+    """
+    agent_2 is not active after reset, the infos are kept on the environment
+    """
+
+    def reset(self, seed=None, options=None):
+        self.num_steps = 0
+        self.agents = self.possible_agents[:2]
+        self.infos = {agent: {"step": 0} for agent in self.possible_agents}
+        return {agent: self.observe(agent) for agent in self.agents}, self.infos
+
+
+def test_active_mask_copies_infos():
+    env = MarkovVectorEnv(LateAgentEnv(), active_mask=True)
+    _, infos = env.reset()
+    assert [info.get("active", True) for info in infos] == [True, True, False]
+    # the environment's own info dicts are not modified
+    assert all(info == {"step": 0} for info in env.par_env.infos.values())
+
     """
     If we reach (and pass) the end of the episode, the last observation is returned in the info dict.
     """